@@ -2,214 +2,588 @@
 Categorizer Module - AI-powered merchant categorization using Gemini
 """
 
+import asyncio
 import os
-from typing import Optional
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
+from logger import get_logger
+
+try:
+    import ahocorasick
+except ImportError:  # optional: keyword fallback uses a pure-Python trie
+    ahocorasick = None
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger('categorizer')
 
-def get_valid_categories() -> list:
-    """
-    Return list of valid transaction categories
-    
-    Returns:
-        List of category strings
-    """
-    return [
-        "Food and Drinks",
-        "Groceries",
-        "Shopping",
-        "Entertainment",
-        "Travel and Transport",
-        "Bills and Utilities",
-        "Healthcare",
-        "Education",
-        "Investments",
-        "Personal Care",
-        "Subscriptions",
-        "Others"
-    ]
+# Gemini model, configured lazily on first use and reused across calls
+_MODEL = None
 
+# Valid transaction categories, built once and shared by every caller
+_VALID_CATEGORIES = (
+    "Food and Drinks",
+    "Groceries",
+    "Shopping",
+    "Entertainment",
+    "Travel and Transport",
+    "Bills and Utilities",
+    "Healthcare",
+    "Education",
+    "Investments",
+    "Personal Care",
+    "Subscriptions",
+    "Others"
+)
+_VALID_CATEGORIES_SET = frozenset(_VALID_CATEGORIES)
 
-def categorize_merchant(merchant_name: str) -> str:
+
+def get_valid_categories() -> tuple:
     """
-    Use Gemini AI to categorize a merchant into predefined categories
-    
-    Args:
-        merchant_name: Name of the merchant/store
+    Return the valid transaction categories
     
     Returns:
-        Category string (falls back to "Others" on error)
+        Tuple of category strings (shared, immutable)
     """
-    try:
-        # Get API key from environment
-        api_key = os.getenv("GEMINI_API_KEY")
-        
-        if not api_key:
-            print("⚠️ WARNING: GEMINI_API_KEY not found in .env, using fallback categorization")
-            return categorize_merchant_fallback(merchant_name)
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Create prompt
-        valid_categories = get_valid_categories()
-        categories_str = ", ".join(valid_categories)
-        
-        prompt = f"""Categorize this merchant into ONE category from the following list:
-{categories_str}
+    return _VALID_CATEGORIES
 
-Merchant: {merchant_name}
 
-Return ONLY the category name, nothing else. Choose the most appropriate category."""
-        
-        # Generate response
-        response = model.generate_content(prompt)
-        category = response.text.strip()
-        
-        # Validate response is in valid categories
-        if category in valid_categories:
-            return category
-        
-        # Try to find a partial match
-        for valid_cat in valid_categories:
-            if valid_cat.lower() in category.lower() or category.lower() in valid_cat.lower():
-                return valid_cat
-        
-        # If no match, use fallback
-        print(f"⚠️ Gemini returned invalid category '{category}', using fallback")
-        return categorize_merchant_fallback(merchant_name)
-        
-    except Exception as e:
-        print(f"⚠️ Error calling Gemini API: {e}")
-        print(f"   Using fallback categorization for: {merchant_name}")
-        return categorize_merchant_fallback(merchant_name)
+_CATEGORIES_STR = ", ".join(_VALID_CATEGORIES)
+_VALID_CATEGORIES_LOWER = tuple((cat.lower(), cat) for cat in _VALID_CATEGORIES)
 
+# Attempts per Gemini request when rate limited (async path)
+_MAX_RETRIES = 4
 
-def categorize_merchant_fallback(merchant_name: str) -> str:
-    """
-    Fallback categorization using keyword matching
-    
-    Args:
-        merchant_name: Name of the merchant/store
-    
-    Returns:
-        Category string
-    """
-    merchant_lower = merchant_name.lower()
-    
+# Matches "<number>. <Category>" lines in batched Gemini responses
+_ANSWER_RE = re.compile(r'^\s*(\d+)\.\s*(.+)$', re.MULTILINE)
+
+# LRU cache of Gemini categories, keyed by normalized merchant name
+_CATEGORY_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_CATEGORY_CACHE_SIZE = 4096
+_CATEGORY_CACHE_LOCK = threading.Lock()
+_NORMALIZE_RE = re.compile(r'[^a-z0-9 ]+')
+
+# Keyword rules for fallback categorization, checked in priority order:
+# the first category (top to bottom) with a keyword found in the merchant
+# name wins, e.g. "Food and Drinks" beats "Groceries".
+_FALLBACK_RULES = (
     # Food and Drinks keywords (restaurants, cafes, food delivery)
-    if any(keyword in merchant_lower for keyword in [
+    ("Food and Drinks", (
         'restaurant', 'cafe', 'coffee', 'pizza', 'burger', 'food',
         'domino', 'mcdonald', 'kfc', 'subway', 'starbucks',
         'swiggy', 'zomato', 'ubereats', 'dining', 'kitchen',
         'biryani', 'dhaba', 'bar', 'pub', 'drinks',
         'bakery', 'tea', 'juice', 'ice cream', 'dunkin'
-    ]):
-        return "Food and Drinks"
-    
+    )),
     # Groceries keywords (supermarkets, fresh produce)
-    if any(keyword in merchant_lower for keyword in [
+    ("Groceries", (
         'grocery', 'supermarket', 'blinkit', 'bigbasket', 'grofers',
         'instamart', 'dunzo', 'fresh', 'vegetables', 'fruits',
         'dmart', 'reliance fresh', 'more megastore', 'nature\'s basket',
         'spencer', 'star bazaar', 'jiomart'
-    ]):
-        return "Groceries"
-    
+    )),
     # Shopping keywords (e-commerce, retail, fashion)
-    if any(keyword in merchant_lower for keyword in [
+    ("Shopping", (
         'amazon', 'flipkart', 'myntra', 'ajio', 'meesho',
         'shop', 'store', 'mart', 'bazaar', 'mall', 'retail',
         'fashion', 'clothing', 'electronics', 'apparel',
         'furniture', 'decor', 'snapdeal', 'nykaa', 'lenskart',
         'vijay sales', 'croma', 'reliance digital'
-    ]):
-        return "Shopping"
-    
+    )),
     # Entertainment keywords (streaming, movies, events)
-    if any(keyword in merchant_lower for keyword in [
+    ("Entertainment", (
         'netflix', 'prime', 'hotstar', 'spotify', 'youtube',
         'movie', 'cinema', 'theater', 'theatre', 'pvr', 'inox',
         'game', 'entertainment', 'music', 'concert', 'event',
         'bookmyshow', 'paytm insider', 'sony liv', 'zee5',
         'disney', 'voot', 'mx player'
-    ]):
-        return "Entertainment"
-    
+    )),
     # Travel and Transport keywords (cabs, flights, hotels, fuel)
-    if any(keyword in merchant_lower for keyword in [
+    ("Travel and Transport", (
         'uber', 'ola', 'rapido', 'taxi', 'cab', 'metro',
         'bus', 'train', 'flight', 'airline', 'fuel', 'petrol',
         'transport', 'travel', 'hotel', 'resort', 'booking',
         'airbnb', 'makemytrip', 'goibibo', 'cleartrip', 'irctc',
         'indigo', 'spicejet', 'vistara', 'air india', 'diesel',
         'parking', 'toll', 'oyo'
-    ]):
-        return "Travel and Transport"
-    
+    )),
     # Bills and Utilities keywords (electricity, water, internet, phone)
-    if any(keyword in merchant_lower for keyword in [
+    ("Bills and Utilities", (
         'electricity', 'water', 'gas', 'bill', 'utility',
         'broadband', 'internet', 'wifi', 'recharge', 'mobile',
         'airtel', 'jio', 'vodafone', 'bsnl', 'tata', 'adani',
         'reliance', 'postpaid', 'prepaid', 'tata sky', 'dish tv',
         'sun direct', 'airtel digital', 'dth'
-    ]):
-        return "Bills and Utilities"
-    
+    )),
     # Healthcare keywords (hospitals, pharmacy, medical)
-    if any(keyword in merchant_lower for keyword in [
+    ("Healthcare", (
         'hospital', 'clinic', 'doctor', 'medical', 'health',
         'pharmacy', 'apollo', 'medplus', 'netmeds', '1mg',
         'pharmeasy', 'medicine', 'diagnostic', 'lab', 'test',
         'fortis', 'max', 'manipal', 'narayana', 'dental',
         'physiotherapy', 'ayurveda'
-    ]):
-        return "Healthcare"
-    
+    )),
     # Education keywords (courses, books, tuition)
-    if any(keyword in merchant_lower for keyword in [
+    ("Education", (
         'education', 'school', 'college', 'university', 'course',
         'tuition', 'coaching', 'udemy', 'coursera', 'upgrad',
         'byju', 'unacademy', 'vedantu', 'toppr', 'book',
         'library', 'stationery', 'exam', 'fees', 'admission'
-    ]):
-        return "Education"
-    
+    )),
     # Investments keywords (mutual funds, stocks, insurance)
-    if any(keyword in merchant_lower for keyword in [
+    ("Investments", (
         'investment', 'mutual fund', 'stock', 'sip', 'insurance',
         'zerodha', 'groww', 'upstox', 'angel', 'paytm money',
         'lic', 'hdfc life', 'icici prudential', 'sbi life',
         'policy', 'premium', 'fd', 'fixed deposit', 'recurring'
-    ]):
-        return "Investments"
-    
+    )),
     # Personal Care keywords (salon, spa, beauty, gym)
-    if any(keyword in merchant_lower for keyword in [
+    ("Personal Care", (
         'salon', 'spa', 'beauty', 'parlour', 'gym', 'fitness',
         'yoga', 'massage', 'wellness', 'hair', 'skin',
         'cult.fit', 'urban company', 'lakme', 'vlcc',
         'grooming', 'cosmetics', 'makeup'
-    ]):
-        return "Personal Care"
-    
+    )),
     # Subscriptions keywords (recurring services)
-    if any(keyword in merchant_lower for keyword in [
+    ("Subscriptions", (
         'subscription', 'monthly', 'annual', 'membership',
         'amazon prime', 'youtube premium', 'linkedin premium',
         'office 365', 'adobe', 'microsoft', 'apple',
         'google one', 'icloud', 'dropbox', 'canva pro'
-    ]):
-        return "Subscriptions"
+    )),
+)
+
+
+def _get_model():
+    """
+    Return the shared Gemini model, configuring the client on first use
+
+    Returns:
+        GenerativeModel instance
+    """
+    global _MODEL
+
+    if _MODEL is None:
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _MODEL = genai.GenerativeModel('gemini-2.0-flash-exp')
+
+    return _MODEL
+
+
+def _normalize(merchant_name: str) -> str:
+    """
+    Normalize a merchant name into a cache key ("Amazon India" == "amazon  india!")
+    
+    Args:
+        merchant_name: Name of the merchant/store
+    
+    Returns:
+        Lowercased name with punctuation removed
+    """
+    return " ".join(_NORMALIZE_RE.sub('', merchant_name.lower()).split())
+
+
+def _cache_get(merchant_name: str) -> Optional[str]:
+    """Return the cached category for a merchant, or None on a miss"""
+    key = _normalize(merchant_name)
+    
+    with _CATEGORY_CACHE_LOCK:
+        category = _CATEGORY_CACHE.get(key)
+        if category is not None:
+            _CATEGORY_CACHE.move_to_end(key)
+    
+    return category
+
+
+def _cache_put(merchant_name: str, category: str) -> None:
+    """Store a category for a merchant, evicting the least recently used entry"""
+    key = _normalize(merchant_name)
+    
+    with _CATEGORY_CACHE_LOCK:
+        _CATEGORY_CACHE[key] = category
+        _CATEGORY_CACHE.move_to_end(key)
+        if len(_CATEGORY_CACHE) > _CATEGORY_CACHE_SIZE:
+            _CATEGORY_CACHE.popitem(last=False)
+
+
+def _split_cached(merchant_names: List[str]):
+    """
+    Look merchants up in the category cache
+    
+    Args:
+        merchant_names: Names of the merchants/stores
+    
+    Returns:
+        Tuple of (categories with None for misses, unique missed names)
+    """
+    categories = [_cache_get(name) for name in merchant_names]
+    
+    pending = {}
+    for name, category in zip(merchant_names, categories):
+        if category is None:
+            pending.setdefault(_normalize(name), name)
+    
+    return categories, list(pending.values())
+
+
+def _merge_cached(merchant_names: List[str], categories: List[Optional[str]],
+                  resolved_names: List[str], resolved: List[str]) -> List[str]:
+    """Fill cache misses in `categories` with freshly resolved categories"""
+    by_key = {
+        _normalize(name): category
+        for name, category in zip(resolved_names, resolved)
+    }
+    
+    return [
+        category if category is not None else by_key[_normalize(name)]
+        for name, category in zip(merchant_names, categories)
+    ]
+
+
+def _match_category(answer: str) -> Optional[str]:
+    """
+    Map a category name returned by Gemini onto a valid category
+    
+    Args:
+        answer: Raw category text from the model
+    
+    Returns:
+        Valid category string, or None if nothing matches
+    """
+    if not answer:
+        return None
+    
+    if answer in _VALID_CATEGORIES_SET:
+        return answer
+    
+    # Try to find a partial match
+    answer_lower = answer.lower()
+    for valid_lower, valid_cat in _VALID_CATEGORIES_LOWER:
+        if valid_lower in answer_lower or answer_lower in valid_lower:
+            return valid_cat
+    
+    return None
+
+
+def _build_batch_prompt(merchant_names: List[str]) -> str:
+    """
+    Build a single Gemini prompt asking for one category per merchant
+    
+    Args:
+        merchant_names: Merchant names to include in the prompt
+    
+    Returns:
+        Prompt string with the merchants as a numbered list
+    """
+    merchants_str = "\n".join(
+        f"{i}. {name}" for i, name in enumerate(merchant_names, 1)
+    )
+    
+    return f"""Categorize each merchant below into ONE category from the following list:
+{_CATEGORIES_STR}
+
+Merchants:
+{merchants_str}
+
+Return exactly {len(merchant_names)} lines in the same order, formatted as "<number>. <Category>".
+Return ONLY the numbered category names, nothing else. Choose the most appropriate category."""
+
+
+def _resolve_batch(merchant_names: List[str], response_text: Optional[str]) -> List[str]:
+    """
+    Turn a batched Gemini response into categories, falling back per merchant
+    
+    Args:
+        merchant_names: Merchant names in prompt order
+        response_text: Raw response text, or None if the request failed
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    answers = {}
+    if response_text:
+        answers = {
+            int(index): category.strip()
+            for index, category in _ANSWER_RE.findall(response_text)
+        }
+        
+        # A single merchant often gets a bare "<Category>" line back
+        if not answers and len(merchant_names) == 1 and response_text.strip():
+            answers[1] = response_text.strip().splitlines()[0].strip()
+    
+    categories = []
+    for i, merchant_name in enumerate(merchant_names, 1):
+        category = _match_category(answers.get(i, ""))
+        
+        if category is None:
+            if i not in answers and response_text is not None:
+                logger.warning(f"⚠️ Gemini returned no category for '{merchant_name}', using fallback")
+            elif i in answers:
+                logger.warning(f"⚠️ Gemini returned invalid category '{answers[i]}' for '{merchant_name}', using fallback")
+            category = categorize_merchant_fallback(merchant_name)
+        else:
+            # Only Gemini answers are cached; fallbacks are retried next time
+            _cache_put(merchant_name, category)
+        
+        categories.append(category)
+    
+    return categories
+
+
+def _categorize_batch(merchant_names: List[str]) -> List[str]:
+    """
+    Categorize a batch of merchants with a single Gemini request
+    
+    Args:
+        merchant_names: Merchant names to categorize (one prompt for all)
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    response_text = None
+    
+    try:
+        response = _get_model().generate_content(_build_batch_prompt(merchant_names))
+        response_text = response.text
+    except Exception as e:
+        logger.warning(f"⚠️ Error calling Gemini API: {e}")
+        logger.warning(f"   Using fallback categorization for {len(merchant_names)} merchant(s)")
+    
+    return _resolve_batch(merchant_names, response_text)
+
+
+async def _categorize_batch_async(merchant_names: List[str], semaphore: asyncio.Semaphore) -> List[str]:
+    """
+    Async variant of _categorize_batch, retrying with jitter when throttled
+    
+    Args:
+        merchant_names: Merchant names to categorize (one prompt for all)
+        semaphore: Limits how many Gemini requests are in flight
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    response_text = None
+    prompt = _build_batch_prompt(merchant_names)
+    
+    async with semaphore:
+        for attempt in range(_MAX_RETRIES):
+            try:
+                response = await _get_model().generate_content_async(prompt)
+                response_text = response.text
+                break
+            except google_exceptions.ResourceExhausted:
+                # Rate limited (429) - back off with full jitter, then retry
+                await asyncio.sleep(random.uniform(0, 2 ** attempt))
+            except Exception as e:
+                logger.warning(f"⚠️ Error calling Gemini API: {e}")
+                break
+    
+    if response_text is None:
+        logger.warning(f"   Using fallback categorization for {len(merchant_names)} merchant(s)")
+    
+    return _resolve_batch(merchant_names, response_text)
+
+
+def categorize_merchants(merchant_names: List[str], batch_size: int = 25) -> List[str]:
+    """
+    Use Gemini AI to categorize many merchants, batching them into few requests
+    
+    Args:
+        merchant_names: Names of the merchants/stores
+        batch_size: Maximum number of merchants sent in one prompt
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    if not merchant_names:
+        return []
+    
+    if not os.getenv("GEMINI_API_KEY"):
+        logger.warning("⚠️ WARNING: GEMINI_API_KEY not found in .env, using fallback categorization")
+        return [categorize_merchant_fallback(name) for name in merchant_names]
+    
+    categories, pending = _split_cached(merchant_names)
+    if not pending:
+        return categories
+    
+    resolved = []
+    for start in range(0, len(pending), batch_size):
+        resolved.extend(_categorize_batch(pending[start:start + batch_size]))
+    
+    return _merge_cached(merchant_names, categories, pending, resolved)
+
+
+def categorize_merchant(merchant_name: str) -> str:
+    """
+    Use Gemini AI to categorize a merchant into predefined categories
+    
+    Args:
+        merchant_name: Name of the merchant/store
+    
+    Returns:
+        Category string (falls back to keyword matching on error)
+    """
+    return categorize_merchants([merchant_name])[0]
+
+
+async def categorize_merchants_async(
+    merchant_names: List[str],
+    batch_size: int = 25,
+    concurrency: int = 8
+) -> List[str]:
+    """
+    Categorize many merchants with up to `concurrency` Gemini requests in flight
+    
+    Args:
+        merchant_names: Names of the merchants/stores
+        batch_size: Maximum number of merchants sent in one prompt
+            (use 1 to send every merchant as its own request)
+        concurrency: Maximum number of concurrent Gemini requests
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    if not merchant_names:
+        return []
+    
+    if not os.getenv("GEMINI_API_KEY"):
+        logger.warning("⚠️ WARNING: GEMINI_API_KEY not found in .env, using fallback categorization")
+        return [categorize_merchant_fallback(name) for name in merchant_names]
+    
+    categories, pending = _split_cached(merchant_names)
+    if not pending:
+        return categories
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = await asyncio.gather(*[
+        _categorize_batch_async(pending[start:start + batch_size], semaphore)
+        for start in range(0, len(pending), batch_size)
+    ])
+    resolved = [category for batch in batches for category in batch]
+    
+    return _merge_cached(merchant_names, categories, pending, resolved)
+
+
+def categorize_merchants_parallel(
+    merchant_names: List[str],
+    batch_size: int = 25,
+    concurrency: int = 8
+) -> List[str]:
+    """
+    Synchronous wrapper around categorize_merchants_async
+    
+    Must not be called from inside a running event loop; await
+    categorize_merchants_async directly there instead.
+    
+    Args:
+        merchant_names: Names of the merchants/stores
+        batch_size: Maximum number of merchants sent in one prompt
+        concurrency: Maximum number of concurrent Gemini requests
+    
+    Returns:
+        Category strings in the same order as merchant_names
+    """
+    return asyncio.run(categorize_merchants_async(merchant_names, batch_size, concurrency))
+
+
+def _build_keyword_automaton():
+    """
+    Compile every fallback keyword into one Aho-Corasick automaton
+    
+    Returns:
+        Automaton mapping keyword -> (priority, category), or None if
+        pyahocorasick is not installed
+    """
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for priority, (category, keywords) in enumerate(_FALLBACK_RULES):
+        for keyword in keywords:
+            if keyword not in automaton:
+                automaton.add_word(keyword, (priority, category))
+    automaton.make_automaton()
+    
+    return automaton
+
+
+def _build_keyword_trie() -> dict:
+    """
+    Build a character trie over every fallback keyword (pure-Python matcher)
+    
+    Returns:
+        Nested dicts keyed by character; the None key of a node holds the
+        (priority, category) of the keyword ending there
+    """
+    root = {}
+    for priority, (category, keywords) in enumerate(_FALLBACK_RULES):
+        for keyword in keywords:
+            node = root
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node.setdefault(None, (priority, category))
+    
+    return root
+
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+_KEYWORD_TRIE = _build_keyword_trie() if _KEYWORD_AUTOMATON is None else None
+
+
+def _iter_trie_matches(text: str):
+    """
+    Yield (priority, category) for every keyword occurring in text
+    
+    Args:
+        text: Lowercased merchant name
+    """
+    length = len(text)
+    for start in range(length):
+        node = _KEYWORD_TRIE
+        for i in range(start, length):
+            node = node.get(text[i])
+            if node is None:
+                break
+            match = node.get(None)
+            if match is not None:
+                yield match
+
+
+def categorize_merchant_fallback(merchant_name: str) -> str:
+    """
+    Fallback categorization using keyword matching
+    
+    Args:
+        merchant_name: Name of the merchant/store
+    
+    Returns:
+        Category string
+    """
+    merchant_lower = merchant_name.lower()
+    
+    if _KEYWORD_AUTOMATON is not None:
+        matches = (match for _, match in _KEYWORD_AUTOMATON.iter(merchant_lower))
+    else:
+        matches = _iter_trie_matches(merchant_lower)
+    
+    # Single pass over the name; keep the highest-priority hit
+    best = None
+    for priority, category in matches:
+        if best is None or priority < best[0]:
+            best = (priority, category)
+            if priority == 0:
+                break
     
     # Default to Others
-    return "Others"
+    return best[1] if best else "Others"
 
 
 # Example usage and testing
@@ -230,3 +604,4 @@ if __name__ == "__main__":
     for merchant in test_merchants:
         category = categorize_merchant(merchant)
         print(f"{merchant:30} → {category}")
+
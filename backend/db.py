@@ -4,32 +4,107 @@ Handles all database interactions for SplitMint
 """
 
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict, Optional
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 from dotenv import load_dotenv
+from logger import get_logger
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger('db')
+
 # Global database connection
 db = None
 client = None
 
+# Set once the splits collection and its indexes exist
+_splits_ready = False
+
+# Fields returned by transaction list queries ($project stage, _id as string)
+_TXN_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "user_id": 1,
+    "merchant": 1,
+    "amount": 1,
+    "category": 1,
+    "date": 1,
+    "email_subject": 1,
+    "created_at": 1
+}
+
+# Field names clients may request from transaction list queries
+TRANSACTION_FIELDS = frozenset(_TXN_PROJECTION)
+
+# Legacy category spellings mapped to the categorizer's canonical names
+_CATEGORY_ALIASES = {
+    "Food & Dining": "Food and Drinks",
+    "Food & Drinks": "Food and Drinks",
+    "Shopping & E-commerce": "Shopping",
+    "Transport": "Travel and Transport",
+    "Travel & Transport": "Travel and Transport",
+    "Bills & Utilities": "Bills and Utilities",
+}
+
+
+def _txn_projection(fields: Optional[List[str]] = None) -> Dict:
+    """
+    Build the $project stage for transaction list queries
+    
+    Args:
+        fields: Subset of _TXN_PROJECTION keys to return (all when None)
+    
+    Returns:
+        Projection dict; _id is excluded unless requested
+    """
+    if not fields:
+        return _TXN_PROJECTION
+    
+    projection = {"_id": 0}
+    projection.update((field, _TXN_PROJECTION[field]) for field in fields)
+    return projection
+
+
+def _drop_index_if_exists(collection, name: str):
+    """Drop an index superseded by a newer one, ignoring it if already gone"""
+    if name in collection.index_information():
+        collection.drop_index(name)
+        logger.info(f"🧹 Dropped redundant index '{name}' on '{collection.name}'")
+
 
 def connect_db():
-    """Initialize MongoDB connection"""
+    """
+    Initialize MongoDB connection
+    
+    The client holds the connection pool for the whole process, so calls
+    after a successful connect return immediately.
+    """
     global db, client
     
+    if db is not None:
+        return True
+    
     try:
         mongodb_uri = os.getenv("MONGODB_URI")
         if not mongodb_uri:
-            print("❌ ERROR: MONGODB_URI not found in .env file")
+            logger.error("❌ ERROR: MONGODB_URI not found in .env file")
             return False
         
-        print("🔗 Connecting to MongoDB...")
-        client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
+        logger.info("🔗 Connecting to MongoDB...")
+        # tz_aware: timestamps come back as UTC-aware datetimes and are
+        # serialized with an explicit offset. Wire compression cuts bytes on
+        # list queries; zlib is the fallback when zstandard isn't installed.
+        client = MongoClient(
+            mongodb_uri,
+            serverSelectionTimeoutMS=5000,
+            tz_aware=True,
+            maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+            compressors=os.getenv("MONGODB_COMPRESSORS", "zstd,zlib"),
+            retryWrites=True,
+            w=1
+        )
         
         # Test connection
         client.admin.command('ping')
@@ -38,32 +113,68 @@ def connect_db():
         db = client["splitmint"]
         
         # Create collections if they don't exist
-        if "transactions" not in db.list_collection_names():
+        existing = db.list_collection_names()
+        if "transactions" not in existing:
             db.create_collection("transactions")
-            print("✅ Created 'transactions' collection")
+            logger.info("✅ Created 'transactions' collection")
         
-        if "budgets" not in db.list_collection_names():
+        if "budgets" not in existing:
             db.create_collection("budgets")
-            print("✅ Created 'budgets' collection")
+            logger.info("✅ Created 'budgets' collection")
         
-        # Create indexes for faster queries
-        db.transactions.create_index([("user_id", ASCENDING)])
-        db.transactions.create_index([("date", ASCENDING)])
+        # Create indexes for faster queries: every list query filters on
+        # user_id and sorts by date desc, which this one index serves
+        db.transactions.create_index([("user_id", ASCENDING), ("date", DESCENDING)], name="user_date")
+        _drop_index_if_exists(db.transactions, "user_id_1")
+        _drop_index_if_exists(db.transactions, "date_1")
         db.budgets.create_index([("user_id", ASCENDING), ("month", ASCENDING)], unique=True)
         
-        print("✅ MongoDB connection established successfully!")
-        print(f"📦 Database: splitmint")
-        print(f"📊 Collections: transactions, budgets")
+        # Let the server reject duplicate imported transactions. Manual entries
+        # (no email_subject) may legitimately repeat, so they are not covered.
+        try:
+            db.transactions.create_index(
+                [("user_id", ASCENDING), ("merchant", ASCENDING), ("amount", ASCENDING), ("date", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"email_subject": {"$type": "string"}},
+                name="dedup_idx"
+            )
+        except OperationFailure as e:
+            # Imports still check for duplicates with find_existing_transactions,
+            # but two concurrent runs can both insert the same transaction
+            logger.error(f"❌ Could not create transaction dedup index (existing duplicates?): {e}")
+            logger.error("   Duplicate imports are only caught by the pre-insert query until it is fixed")
+        
+        create_split_collection()
+        db.gmail_sync.create_index([("user_id", ASCENDING)], unique=True)
+        
+        logger.info("✅ MongoDB connection established successfully!")
+        logger.info(f"📦 Database: splitmint")
+        logger.info(f"📊 Collections: transactions, budgets, splits")
         return True
         
     except ConnectionFailure as e:
-        print(f"❌ Failed to connect to MongoDB: {e}")
+        logger.error(f"❌ Failed to connect to MongoDB: {e}")
+        db = None
         return False
     except Exception as e:
-        print(f"❌ Database error: {e}")
+        logger.error(f"❌ Database error: {e}")
+        db = None
         return False
 
 
+def close_db():
+    """Close the MongoDB client and its connection pool"""
+    global db, client, _splits_ready
+    
+    if client is not None:
+        client.close()
+        logger.info("🔌 MongoDB connection closed")
+    
+    db = None
+    client = None
+    _splits_ready = False
+
+
 def insert_transaction(
     user_id: str,
     merchant: str,
@@ -94,43 +205,42 @@ def insert_transaction(
             "category": category,
             "date": date,
             "email_subject": email_subject,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         
         result = db.transactions.insert_one(transaction)
         return str(result.inserted_id)
         
     except Exception as e:
-        print(f"❌ Error inserting transaction: {e}")
+        logger.error(f"❌ Error inserting transaction: {e}")
         return None
 
 
-def get_transactions(user_id: str, limit: int = 100) -> List[Dict]:
+def get_transactions(user_id: str, limit: int = 100, fields: Optional[List[str]] = None) -> List[Dict]:
     """
     Get all transactions for a user, sorted by date (newest first)
     
     Args:
         user_id: User identifier
         limit: Maximum number of transactions to return
+        fields: Only return these fields (all when None)
     
     Returns:
         List of transaction dictionaries
     """
     try:
-        transactions = db.transactions.find(
-            {"user_id": user_id}
-        ).sort("date", -1).limit(limit)
+        # The server converts ObjectId to string while projecting
+        cursor = db.transactions.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"date": -1}},
+            {"$limit": limit},
+            {"$project": _txn_projection(fields)}
+        ], batchSize=min(limit, 500))
         
-        # Convert ObjectId to string and return as list
-        result = []
-        for t in transactions:
-            t["_id"] = str(t["_id"])
-            result.append(t)
-        
-        return result
+        return list(cursor)
         
     except Exception as e:
-        print(f"❌ Error fetching transactions: {e}")
+        logger.error(f"❌ Error fetching transactions: {e}")
         return []
 
 
@@ -163,10 +273,99 @@ def check_duplicate_transaction(
         return existing is not None
         
     except Exception as e:
-        print(f"❌ Error checking duplicate: {e}")
+        logger.error(f"❌ Error checking duplicate: {e}")
         return False
 
 
+def find_existing_transactions(user_id: str, keys: List[tuple]) -> set:
+    """
+    Check many transactions for duplicates in one query
+    
+    Args:
+        user_id: User identifier
+        keys: (merchant, amount, date) tuples to look up
+    
+    Returns:
+        Set of the (merchant, amount, date) tuples that already exist
+    """
+    if not keys:
+        return set()
+    
+    try:
+        cursor = db.transactions.find(
+            {
+                "user_id": user_id,
+                "$or": [
+                    {"merchant": merchant, "amount": amount, "date": date_str}
+                    for merchant, amount, date_str in keys
+                ]
+            },
+            {"_id": 0, "merchant": 1, "amount": 1, "date": 1}
+        )
+        
+        return {(doc["merchant"], doc["amount"], doc["date"]) for doc in cursor}
+        
+    except Exception as e:
+        logger.error(f"❌ Error checking duplicates: {e}")
+        return set()
+
+
+def insert_transactions_many(user_id: str, txns: List[Dict]) -> tuple:
+    """
+    Insert many transaction documents in one round trip
+    
+    Imported transactions (with an email_subject) that already exist are
+    rejected by the server's dedup_idx. Callers check with
+    find_existing_transactions first; this catches rows inserted by a
+    concurrent run in between.
+    
+    Args:
+        user_id: User identifier
+        txns: Dicts with merchant, amount, category, date and optional email_subject
+    
+    Returns:
+        (ids, duplicates): inserted document IDs as strings in the same order
+        as txns (None for any document not inserted), and the set of indexes
+        into txns that were rejected as duplicates
+    """
+    if not txns:
+        return [], set()
+    
+    created_at = datetime.now(timezone.utc)
+    docs = [
+        {
+            "user_id": user_id,
+            "merchant": t["merchant"],
+            "amount": float(t["amount"]),
+            "category": t["category"],
+            "date": t["date"],
+            "email_subject": t.get("email_subject"),
+            "created_at": created_at
+        }
+        for t in txns
+    ]
+    
+    try:
+        # Unordered, so one rejected row doesn't stop the rest
+        db.transactions.insert_many(docs, ordered=False)
+        failed = set()
+        duplicates = set()
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        failed = {err["index"] for err in write_errors}
+        duplicates = {err["index"] for err in write_errors if err.get("code") == 11000}
+    except Exception as e:
+        logger.error(f"❌ Error inserting transactions: {e}")
+        return [None] * len(docs), set()
+    
+    # insert_many assigns each _id on the client before sending
+    ids = [
+        None if i in failed else str(doc["_id"])
+        for i, doc in enumerate(docs)
+    ]
+    return ids, duplicates
+    
+
 def delete_transaction(transaction_id: str, user_id: str) -> bool:
     """
     Delete a transaction by ID
@@ -188,14 +387,14 @@ def delete_transaction(transaction_id: str, user_id: str) -> bool:
         })
         
         if result.deleted_count > 0:
-            print(f"✅ Deleted transaction: {transaction_id}")
+            logger.info(f"✅ Deleted transaction: {transaction_id}")
             return True
         else:
-            print(f"⚠️ Transaction not found or doesn't belong to user: {transaction_id}")
+            logger.warning(f"⚠️ Transaction not found or doesn't belong to user: {transaction_id}")
             return False
         
     except Exception as e:
-        print(f"❌ Error deleting transaction: {e}")
+        logger.error(f"❌ Error deleting transaction: {e}")
         return False
 
 
@@ -213,12 +412,13 @@ def update_budget(user_id: str, income: float, budget: float, month: str) -> boo
         True if successful, False otherwise
     """
     try:
+        now = datetime.now(timezone.utc)
         budget_doc = {
             "user_id": user_id,
             "month": month,
             "income": float(income),
             "budget": float(budget),
-            "updated_at": datetime.utcnow().isoformat()
+            "updated_at": now
         }
         
         # Upsert: update if exists, insert if not
@@ -226,7 +426,7 @@ def update_budget(user_id: str, income: float, budget: float, month: str) -> boo
             {"user_id": user_id, "month": month},
             {
                 "$set": budget_doc,
-                "$setOnInsert": {"created_at": datetime.utcnow().isoformat()}
+                "$setOnInsert": {"created_at": now}
             },
             upsert=True
         )
@@ -234,7 +434,7 @@ def update_budget(user_id: str, income: float, budget: float, month: str) -> boo
         return True
         
     except Exception as e:
-        print(f"❌ Error updating budget: {e}")
+        logger.error(f"❌ Error updating budget: {e}")
         return False
 
 
@@ -262,40 +462,117 @@ def get_budget(user_id: str, month: str) -> Optional[Dict]:
         return None
         
     except Exception as e:
-        print(f"❌ Error fetching budget: {e}")
+        logger.error(f"❌ Error fetching budget: {e}")
+        return None
+
+
+def _month_bounds(month: str) -> tuple:
+    """
+    Get the date range covering a month
+    
+    Args:
+        month: Month in format "YYYY-MM"
+    
+    Returns:
+        Tuple of (first day of month, first day of next month) as YYYY-MM-DD
+    """
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def get_budget_with_spent(user_id: str, month: str) -> Optional[Dict]:
+    """
+    Get a month's budget together with the amount spent, in one query
+    
+    Args:
+        user_id: User identifier
+        month: Month in format "YYYY-MM"
+    
+    Returns:
+        Dictionary with income, budget and total_spent, or None if no budget
+    """
+    try:
+        month_start, next_month_start = _month_bounds(month)
+        rows = list(db.budgets.aggregate([
+            {"$match": {"user_id": user_id, "month": month}},
+            # Uncorrelated sub-pipeline: served by the (user_id, date) index
+            {"$lookup": {
+                "from": "transactions",
+                "pipeline": [
+                    {"$match": {"user_id": user_id, "date": {"$gte": month_start, "$lt": next_month_start}}},
+                    {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+                ],
+                "as": "spent"
+            }},
+            {"$project": {
+                "_id": 0,
+                "income": 1,
+                "budget": 1,
+                "total_spent": {"$ifNull": [{"$arrayElemAt": ["$spent.total", 0]}, 0]}
+            }}
+        ]))
+        
+        return rows[0] if rows else None
+        
+    except Exception as e:
+        logger.error(f"❌ Error fetching budget: {e}")
         return None
 
 
-def get_all_transactions_by_month(user_id: str, month: str) -> List[Dict]:
+def get_all_transactions_by_month(user_id: str, month: str, fields: Optional[List[str]] = None) -> List[Dict]:
     """
     Get all transactions for a user in a specific month
     
     Args:
         user_id: User identifier
         month: Month in format "YYYY-MM"
+        fields: Only return these fields (all when None)
     
     Returns:
         List of transaction dictionaries
     """
     try:
-        # Query for dates starting with the month prefix (e.g., "2025-10")
-        transactions = db.transactions.find({
-            "user_id": user_id,
-            "date": {"$regex": f"^{month}"}
-        }).sort("date", -1)
-        
-        result = []
-        for t in transactions:
-            t["_id"] = str(t["_id"])
-            result.append(t)
+        # ISO date strings sort chronologically, so a month is an index range
+        month_start, next_month_start = _month_bounds(month)
+        cursor = db.transactions.aggregate([
+            {"$match": {"user_id": user_id, "date": {"$gte": month_start, "$lt": next_month_start}}},
+            {"$sort": {"date": -1}},
+            {"$project": _txn_projection(fields)}
+        ], batchSize=500)
         
-        return result
+        return list(cursor)
         
     except Exception as e:
-        print(f"❌ Error fetching monthly transactions: {e}")
+        logger.error(f"❌ Error fetching monthly transactions: {e}")
         return []
 
 
+def get_spending_by_category_from_db(user_id: str, month: str) -> Dict[str, float]:
+    """
+    Sum a user's spending per category for a month on the server
+    
+    Args:
+        user_id: User identifier
+        month: Month in format "YYYY-MM"
+    
+    Returns:
+        Dictionary mapping category to total amount
+    """
+    try:
+        month_start, next_month_start = _month_bounds(month)
+        cursor = db.transactions.aggregate([
+            {"$match": {"user_id": user_id, "date": {"$gte": month_start, "$lt": next_month_start}}},
+            {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}}
+        ])
+        
+        return {row["_id"]: row["total"] for row in cursor}
+        
+    except Exception as e:
+        logger.error(f"❌ Error aggregating spending by category: {e}")
+        return {}
+
+
 def insert_demo_transactions(user_id: str, month: str) -> int:
     """
     Insert 10 sample transactions for testing
@@ -308,44 +585,146 @@ def insert_demo_transactions(user_id: str, month: str) -> int:
         Number of transactions inserted
     """
     demo_data = [
-        {"merchant": "Domino's Pizza", "amount": 450, "category": "Food & Dining", "day": "05"},
-        {"merchant": "Amazon", "amount": 1299, "category": "Shopping & E-commerce", "day": "08"},
-        {"merchant": "Swiggy", "amount": 320, "category": "Food & Dining", "day": "10"},
-        {"merchant": "Uber", "amount": 180, "category": "Transport", "day": "12"},
+        {"merchant": "Domino's Pizza", "amount": 450, "category": "Food and Drinks", "day": "05"},
+        {"merchant": "Amazon", "amount": 1299, "category": "Shopping", "day": "08"},
+        {"merchant": "Swiggy", "amount": 320, "category": "Food and Drinks", "day": "10"},
+        {"merchant": "Uber", "amount": 180, "category": "Travel and Transport", "day": "12"},
         {"merchant": "Netflix", "amount": 649, "category": "Entertainment", "day": "15"},
-        {"merchant": "Big Bazaar", "amount": 2500, "category": "Shopping & E-commerce", "day": "18"},
-        {"merchant": "Zomato", "amount": 280, "category": "Food & Dining", "day": "20"},
+        {"merchant": "Big Bazaar", "amount": 2500, "category": "Shopping", "day": "18"},
+        {"merchant": "Zomato", "amount": 280, "category": "Food and Drinks", "day": "20"},
         {"merchant": "Apollo Pharmacy", "amount": 650, "category": "Healthcare", "day": "22"},
-        {"merchant": "Flipkart", "amount": 899, "category": "Shopping & E-commerce", "day": "25"},
-        {"merchant": "Starbucks", "amount": 220, "category": "Food & Dining", "day": "28"},
+        {"merchant": "Flipkart", "amount": 899, "category": "Shopping", "day": "25"},
+        {"merchant": "Starbucks", "amount": 220, "category": "Food and Drinks", "day": "28"},
     ]
     
-    inserted_count = 0
+    created_at = datetime.now(timezone.utc)
+    docs = [
+        {
+            "user_id": user_id,
+            "merchant": item["merchant"],
+            "amount": float(item["amount"]),
+            "category": item["category"],
+            "date": f"{month}-{item['day']}",
+            "email_subject": f"Payment to {item['merchant']}",
+            "created_at": created_at
+        }
+        for item in demo_data
+    ]
     
     try:
-        for item in demo_data:
-            date_str = f"{month}-{item['day']}"
-            
-            # Check if already exists
-            if not check_duplicate_transaction(user_id, item["merchant"], item["amount"], date_str):
-                transaction_id = insert_transaction(
-                    user_id=user_id,
-                    merchant=item["merchant"],
-                    amount=item["amount"],
-                    category=item["category"],
-                    date=date_str,
-                    email_subject=f"Payment to {item['merchant']}"
-                )
-                
-                if transaction_id:
-                    inserted_count += 1
+        # One round trip; rows already present are rejected by dedup_idx
+        result = db.transactions.insert_many(docs, ordered=False)
+        inserted_count = len(result.inserted_ids)
+    except BulkWriteError as e:
+        inserted_count = e.details.get("nInserted", 0)
+    except Exception as e:
+        logger.error(f"❌ Error inserting demo data: {e}")
+        return 0
+    
+    logger.info(f"✅ Inserted {inserted_count} demo transactions")
+    return inserted_count
+
+
+def canonicalize_categories(user_id: str) -> int:
+    """
+    Rewrite legacy category names on a user's transactions and splits
+    
+    Args:
+        user_id: User identifier
+    
+    Returns:
+        Number of documents updated
+    """
+    global db
+    
+    if db is None:
+        logger.error("❌ Database not connected")
+        return 0
+    
+    operations = [
+        UpdateMany({"user_id": user_id, "category": alias}, {"$set": {"category": canonical}})
+        for alias, canonical in _CATEGORY_ALIASES.items()
+    ]
+    
+    try:
+        updated = 0
+        for collection in (db.transactions, db.splits):
+            result = collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
         
-        print(f"✅ Inserted {inserted_count} demo transactions")
-        return inserted_count
+        logger.info(f"✅ Canonicalized categories on {updated} documents")
+        return updated
+    except BulkWriteError as e:
+        # updated holds the collections finished before the failing one
+        logger.warning(f"⚠️ Some categories could not be canonicalized: {e.details.get('writeErrors', [])[:1]}")
+        return updated + e.details.get("nModified", 0)
+    except Exception as e:
+        logger.error(f"❌ Error canonicalizing categories: {e}")
+        return 0
+
+
+def get_gmail_sync_state(user_id: str) -> tuple:
+    """
+    Get where the last Gmail sync for a user left off
+    
+    Args:
+        user_id: User identifier
+    
+    Returns:
+        (history_id, pending_messages): the saved historyId (None if the
+        user has never synced) and a dict of message IDs to retry, mapped
+        to how many runs have failed on them so far
+    """
+    global db
+    
+    if db is None:
+        return None, {}
+    
+    try:
+        state = db.gmail_sync.find_one(
+            {"user_id": user_id},
+            {"history_id": 1, "pending_messages": 1}
+        )
+        if not state:
+            return None, {}
+        return state.get("history_id"), state.get("pending_messages", {})
+    except Exception as e:
+        logger.error(f"❌ Error reading Gmail sync state: {e}")
+        return None, {}
+
+
+def save_gmail_sync_state(user_id: str, history_id: Optional[str], pending_messages: Dict[str, int]) -> bool:
+    """
+    Save where the next Gmail sync resumes from
+    
+    Args:
+        user_id: User identifier
+        history_id: historyId to resume from (None keeps the saved one)
+        pending_messages: IDs of messages that couldn't be fetched or
+            stored, mapped to their failed attempt count; retried by the
+            next sync
+    
+    Returns:
+        True if saved, False otherwise
+    """
+    global db
+    
+    if db is None:
+        return False
+    
+    try:
+        state = {
+            "pending_messages": dict(pending_messages),
+            "updated_at": datetime.now(timezone.utc)
+        }
+        if history_id:
+            state["history_id"] = history_id
         
+        db.gmail_sync.update_one({"user_id": user_id}, {"$set": state}, upsert=True)
+        return True
     except Exception as e:
-        print(f"❌ Error inserting demo data: {e}")
-        return inserted_count
+        logger.error(f"❌ Error saving Gmail sync state: {e}")
+        return False
 
 
 # ============================================================
@@ -354,31 +733,68 @@ def insert_demo_transactions(user_id: str, month: str) -> int:
 
 def create_split_collection():
     """Create splits collection if it doesn't exist"""
-    global db
+    global db, _splits_ready
     
     if db is None:
-        print("❌ Database not connected")
+        logger.error("❌ Database not connected")
         return False
     
+    if _splits_ready:
+        return True
+    
     try:
         if "splits" not in db.list_collection_names():
             db.create_collection("splits")
-            print("✅ Created 'splits' collection")
+            logger.info("✅ Created 'splits' collection")
         
         # Create index for faster queries
         db.splits.create_index([("transaction_id", ASCENDING)])
-        db.splits.create_index([("user_id", ASCENDING)])
+        db.splits.create_index([("user_id", ASCENDING), ("date", DESCENDING)], name="user_date")
+        _drop_index_if_exists(db.splits, "user_id_1")
         
+        _splits_ready = True
         return True
     except Exception as e:
-        print(f"❌ Error creating splits collection: {e}")
+        logger.error(f"❌ Error creating splits collection: {e}")
         return False
 
 
+def _to_paise(amount: float) -> int:
+    """Convert a rupee amount to integer paise"""
+    return int(round(amount * 100))
+
+
+def _allocate_paise(total_paise: int, weights: List[float]) -> List[int]:
+    """
+    Split an integer paise total by weight using the largest-remainder method
+    
+    Args:
+        total_paise: Amount to split, in paise
+        weights: Relative share of each participant
+    
+    Returns:
+        Shares in paise, summing exactly to total_paise
+    """
+    total_weight = sum(weights)
+    exact = [total_paise * w / total_weight for w in weights]
+    shares = [int(x) for x in exact]
+    
+    # Hand the leftover paise to the largest fractional parts (ties: first listed)
+    leftover = total_paise - sum(shares)
+    by_remainder = sorted(range(len(weights)), key=lambda i: shares[i] - exact[i])
+    for i in by_remainder[:leftover]:
+        shares[i] += 1
+    
+    return shares
+
+
 def calculate_split_amounts(total_amount: float, participants: List[Dict], split_method: str) -> List[Dict]:
     """
     Calculate split amounts for each participant
     
+    Amounts are computed in integer paise, so shares always add up to the
+    transaction amount exactly.
+    
     Args:
         total_amount: Total transaction amount
         participants: List of participant dictionaries
@@ -388,51 +804,52 @@ def calculate_split_amounts(total_amount: float, participants: List[Dict], split
         Updated participants list with calculated amounts
     """
     num_participants = len(participants)
+    total_paise = _to_paise(total_amount)
+    weights = None
     
     if split_method == 'equal':
         # Split equally
-        share_amount = total_amount / num_participants
+        weights = [1] * num_participants
         for participant in participants:
-            participant['share_amount'] = round(share_amount, 2)
             participant['share_percentage'] = round(100 / num_participants, 2)
             participant['share_ratio'] = 1
     
     elif split_method == 'percentage':
         # Split by percentage
-        total_percentage = sum(p.get('share_percentage', 0) for p in participants)
+        weights = [p.get('share_percentage') or 0 for p in participants]
+        total_percentage = sum(weights)
         
         if abs(total_percentage - 100) > 0.01:  # Allow small rounding errors
             raise ValueError(f"Percentages must add up to 100, got {total_percentage}")
-        
-        for participant in participants:
-            percentage = participant.get('share_percentage', 0)
-            participant['share_amount'] = round((percentage / 100) * total_amount, 2)
     
     elif split_method == 'ratio':
         # Split by ratio
-        total_ratio = sum(p.get('share_ratio', 1) for p in participants)
+        weights = [p.get('share_ratio') or 1 for p in participants]
+        total_ratio = sum(weights)
         
-        for participant in participants:
-            ratio = participant.get('share_ratio', 1)
+        for participant, ratio in zip(participants, weights):
             participant['share_percentage'] = round((ratio / total_ratio) * 100, 2)
-            participant['share_amount'] = round((ratio / total_ratio) * total_amount, 2)
+    
+    if weights is not None:
+        for participant, share in zip(participants, _allocate_paise(total_paise, weights)):
+            participant['share_amount'] = share / 100
     
     # Calculate who owes what
-    total_paid = sum(p.get('amount_paid', 0) for p in participants)
+    paid_paise = [_to_paise(p.get('amount_paid', 0)) for p in participants]
     
-    if abs(total_paid - total_amount) > 0.01:
+    if abs(sum(paid_paise) - total_paise) > 1:
+        total_paid = sum(paid_paise) / 100
         raise ValueError(f"Total paid ({total_paid}) must equal transaction amount ({total_amount})")
     
-    for participant in participants:
-        amount_paid = participant.get('amount_paid', 0)
-        share_amount = participant.get('share_amount', 0)
-        participant['amount_owed'] = round(share_amount - amount_paid, 2)
+    for participant, paid in zip(participants, paid_paise):
+        share = _to_paise(participant.get('share_amount', 0))
+        participant['amount_owed'] = (share - paid) / 100
     
     return participants
 
 
 def create_or_update_split(user_id: str, transaction_id: str, participants: List[Dict], 
-                           split_method: str, notes: Optional[str] = None) -> Optional[str]:
+                           split_method: str, notes: Optional[str] = None) -> Optional[Dict]:
     """
     Create or update a split transaction
     
@@ -444,25 +861,22 @@ def create_or_update_split(user_id: str, transaction_id: str, participants: List
         notes: Optional notes
     
     Returns:
-        Split ID if successful, None otherwise
+        The saved split document if successful, None otherwise
     """
     global db
     
     if db is None:
-        print("❌ Database not connected")
+        logger.error("❌ Database not connected")
         return None
     
     try:
         from bson import ObjectId
         
-        # Ensure splits collection exists
-        create_split_collection()
-        
         # Get the original transaction
         transaction = db.transactions.find_one({"_id": ObjectId(transaction_id), "user_id": user_id})
         
         if not transaction:
-            print(f"❌ Transaction {transaction_id} not found")
+            logger.error(f"❌ Transaction {transaction_id} not found")
             return None
         
         # Calculate split amounts
@@ -472,49 +886,132 @@ def create_or_update_split(user_id: str, transaction_id: str, participants: List
             split_method
         )
         
-        # Create split document
-        split_doc = {
-            "user_id": user_id,
-            "transaction_id": transaction_id,
-            "merchant": transaction['merchant'],
-            "total_amount": transaction['amount'],
-            "category": transaction['category'],
-            "date": transaction['date'],
-            "split_method": split_method,
-            "participants": calculated_participants,
-            "notes": notes,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
+        # Create or update the split in one round trip, keeping the
+        # original created_at on updates
+        now = datetime.now(timezone.utc)
+        split = db.splits.find_one_and_update(
+            {"transaction_id": transaction_id, "user_id": user_id},
+            {
+                "$set": {
+                    "merchant": transaction['merchant'],
+                    "total_amount": transaction['amount'],
+                    "category": transaction['category'],
+                    "date": transaction['date'],
+                    "split_method": split_method,
+                    "participants": calculated_participants,
+                    "notes": notes,
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
         
-        # Check if split already exists for this transaction
-        existing_split = db.splits.find_one({"transaction_id": transaction_id, "user_id": user_id})
+        action = "Created" if split["created_at"] == split["updated_at"] else "Updated"
+        logger.info(f"✅ {action} split for transaction {transaction_id}")
         
-        if existing_split:
-            # Update existing split
-            split_doc["updated_at"] = datetime.now().isoformat()
-            db.splits.update_one(
-                {"_id": existing_split["_id"]},
-                {"$set": split_doc}
-            )
-            print(f"✅ Updated split for transaction {transaction_id}")
-            return str(existing_split["_id"])
-        else:
-            # Create new split
-            result = db.splits.insert_one(split_doc)
-            print(f"✅ Created split for transaction {transaction_id}")
-            return str(result.inserted_id)
+        split["_id"] = str(split["_id"])
+        return split
     
     except ValueError as e:
-        print(f"❌ Validation error: {e}")
+        logger.error(f"❌ Validation error: {e}")
         return None
     except Exception as e:
-        print(f"❌ Error creating split: {e}")
+        logger.error(f"❌ Error creating split: {e}")
         import traceback
         traceback.print_exc()
         return None
 
 
+def create_or_update_splits_bulk(user_id: str, items: List[Dict]) -> int:
+    """
+    Create or update several splits in two round-trips
+    
+    Args:
+        user_id: User identifier
+        items: Dicts with 'transaction_id', 'participants', 'split_method'
+               and optional 'notes'
+    
+    Returns:
+        Number of splits created or updated
+    """
+    global db
+    
+    if db is None:
+        logger.error("❌ Database not connected")
+        return 0
+    
+    if not items:
+        return 0
+    
+    try:
+        from bson import ObjectId
+        
+        # Fetch every referenced transaction with one $in query
+        txn_ids = [ObjectId(item["transaction_id"]) for item in items]
+        transactions = {
+            str(t["_id"]): t
+            for t in db.transactions.find({"user_id": user_id, "_id": {"$in": txn_ids}})
+        }
+        
+        now = datetime.now(timezone.utc)
+        operations = []
+        
+        for item in items:
+            transaction_id = item["transaction_id"]
+            transaction = transactions.get(transaction_id)
+            
+            if not transaction:
+                logger.error(f"❌ Transaction {transaction_id} not found")
+                continue
+            
+            try:
+                calculated_participants = calculate_split_amounts(
+                    transaction['amount'],
+                    item["participants"],
+                    item["split_method"]
+                )
+            except ValueError as e:
+                logger.error(f"❌ Validation error for {transaction_id}: {e}")
+                continue
+            
+            split_doc = {
+                "user_id": user_id,
+                "transaction_id": transaction_id,
+                "merchant": transaction['merchant'],
+                "total_amount": transaction['amount'],
+                "category": transaction['category'],
+                "date": transaction['date'],
+                "split_method": item["split_method"],
+                "participants": calculated_participants,
+                "notes": item.get("notes"),
+                "updated_at": now
+            }
+            operations.append(UpdateOne(
+                {"transaction_id": transaction_id, "user_id": user_id},
+                {"$set": split_doc, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            ))
+        
+        if not operations:
+            return 0
+        
+        result = db.splits.bulk_write(operations, ordered=False)
+        written = result.upserted_count + result.matched_count
+        logger.info(f"✅ Saved {written} splits ({result.upserted_count} new)")
+        return written
+    
+    except BulkWriteError as e:
+        details = e.details
+        written = details.get("nUpserted", 0) + details.get("nMatched", 0)
+        logger.warning(f"⚠️ Saved {written} splits, {len(details.get('writeErrors', []))} failed")
+        return written
+    except Exception as e:
+        logger.error(f"❌ Error creating splits: {e}")
+        return 0
+
+
 def get_split_by_transaction(user_id: str, transaction_id: str) -> Optional[Dict]:
     """
     Get split details for a transaction
@@ -529,7 +1026,7 @@ def get_split_by_transaction(user_id: str, transaction_id: str) -> Optional[Dict
     global db
     
     if db is None:
-        print("❌ Database not connected")
+        logger.error("❌ Database not connected")
         return None
     
     try:
@@ -542,7 +1039,7 @@ def get_split_by_transaction(user_id: str, transaction_id: str) -> Optional[Dict
         return None
     
     except Exception as e:
-        print(f"❌ Error getting split: {e}")
+        logger.error(f"❌ Error getting split: {e}")
         return None
 
 
@@ -560,21 +1057,21 @@ def delete_split(user_id: str, transaction_id: str) -> bool:
     global db
     
     if db is None:
-        print("❌ Database not connected")
+        logger.error("❌ Database not connected")
         return False
     
     try:
         result = db.splits.delete_one({"transaction_id": transaction_id, "user_id": user_id})
         
         if result.deleted_count > 0:
-            print(f"✅ Deleted split for transaction {transaction_id}")
+            logger.info(f"✅ Deleted split for transaction {transaction_id}")
             return True
         else:
-            print(f"⚠️ No split found for transaction {transaction_id}")
+            logger.warning(f"⚠️ No split found for transaction {transaction_id}")
             return False
     
     except Exception as e:
-        print(f"❌ Error deleting split: {e}")
+        logger.error(f"❌ Error deleting split: {e}")
         return False
 
 
@@ -591,18 +1088,19 @@ def get_all_splits(user_id: str) -> List[Dict]:
     global db
     
     if db is None:
-        print("❌ Database not connected")
+        logger.error("❌ Database not connected")
         return []
     
     try:
-        splits = list(db.splits.find({"user_id": user_id}).sort("date", -1))
-        
-        # Convert ObjectId to string
-        for split in splits:
-            split["_id"] = str(split["_id"])
+        # The server converts ObjectId to string, so no Python-side pass
+        cursor = db.splits.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"date": -1}},
+            {"$addFields": {"_id": {"$toString": "$_id"}}}
+        ], batchSize=500)
         
-        return splits
+        return list(cursor)
     
     except Exception as e:
-        print(f"❌ Error getting splits: {e}")
+        logger.error(f"❌ Error getting splits: {e}")
         return []
@@ -3,87 +3,161 @@ Background Email Monitor
 Automatically checks for new transaction emails every 45 seconds
 """
 
-import time
+import asyncio
 import threading
-from datetime import datetime
-from process_transactions import process_all_transactions
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from process_transactions import process_all_transactions, process_all_transactions_async
 from dotenv import load_dotenv
+from logger import get_logger
 import os
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger('monitor')
+
 # Configuration
 CHECK_INTERVAL = 45  # 45 seconds
 USER_ID = os.getenv("DEFAULT_USER_ID", "demo_user")
 
-# Flag to control the monitoring
-monitoring_active = True
+# Set to stop the monitoring; waiting on it wakes up immediately when set
+_stop_event = threading.Event()
+
+
+def _log_started():
+    """Log the monitoring banner"""
+    logger.info("\n" + "="*60)
+    logger.info("🔄 EMAIL MONITORING STARTED")
+    logger.info("="*60)
+    logger.info(f"⏱️  Checking every {CHECK_INTERVAL} seconds")
+    logger.info(f"👤 User: {USER_ID}")
+    logger.info(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("="*60 + "\n")
+
+
+def _log_check_started(check_count: int):
+    """
+    Log the start of a check for new transaction emails
+    
+    Args:
+        check_count: Sequence number of this check
+    """
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    logger.info(f"\n{'='*60}")
+    logger.info(f"🔍 Check #{check_count} at {current_time}")
+    logger.info(f"{'='*60}\n")
+
+
+def _log_check_result(result: dict):
+    """
+    Log the outcome of a check
+    
+    Args:
+        result: Summary returned by process_all_transactions
+    """
+    if result['success']:
+        if result['total_new'] > 0:
+            logger.info(f"\n✅ Added {result['total_new']} new transaction(s)!")
+        else:
+            logger.info(f"\n✓ No new transactions found")
+    else:
+        logger.warning(f"\n⚠️ Check failed: {result.get('message', 'Unknown error')}")
+
+
+def _log_next_check():
+    """Log when the next check is due"""
+    next_check = datetime.now() + timedelta(seconds=CHECK_INTERVAL)
+    logger.info(f"\n⏳ Next check at: {next_check.strftime('%H:%M:%S')}")
+    logger.info(f"💤 Sleeping for {CHECK_INTERVAL} seconds...")
+
+
+def _after_check(result: Optional[dict], error: Optional[Exception], backoff: int) -> Tuple[int, int]:
+    """
+    Log the outcome of a check and work out how long to wait before the next one
+    
+    Shared by the thread and asyncio monitors so both follow the same schedule.
+    
+    Args:
+        result: Summary returned by process_all_transactions (None if it raised)
+        error: Exception raised by the check, or None
+        backoff: Seconds to wait if this check failed
+    
+    Returns:
+        Tuple of (seconds to wait, backoff for the next check)
+    """
+    if error is not None:
+        logger.error(f"\n❌ Error during monitoring: {error}")
+        logger.info(f"⏳ Retrying in {backoff} seconds...")
+        # Back off exponentially, capped at the normal interval
+        return backoff, min(backoff * 2, CHECK_INTERVAL)
+    
+    _log_check_result(result)
+    _log_next_check()
+    return CHECK_INTERVAL, 1
 
 
 def monitor_emails():
     """
     Background task that checks for new emails periodically
     """
-    global monitoring_active
-    
-    print("\n" + "="*60)
-    print("🔄 EMAIL MONITORING STARTED")
-    print("="*60)
-    print(f"⏱️  Checking every {CHECK_INTERVAL} seconds")
-    print(f"👤 User: {USER_ID}")
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("="*60 + "\n")
+    _log_started()
     
     check_count = 0
+    backoff = 1
     
-    while monitoring_active:
-        try:
-            check_count += 1
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            print(f"\n{'='*60}")
-            print(f"🔍 Check #{check_count} at {current_time}")
-            print(f"{'='*60}\n")
-            
-            # Process transactions
-            result = process_all_transactions(USER_ID)
-            
-            if result['success']:
-                if result['total_new'] > 0:
-                    print(f"\n✅ Added {result['total_new']} new transaction(s)!")
-                else:
-                    print(f"\n✓ No new transactions found")
-            else:
-                print(f"\n⚠️ Check failed: {result.get('message', 'Unknown error')}")
-            
-            # Wait for next check
-            if monitoring_active:
-                from datetime import timedelta
-                next_check = datetime.now() + timedelta(seconds=CHECK_INTERVAL)
-                print(f"\n⏳ Next check at: {next_check.strftime('%H:%M:%S')}")
-                print(f"💤 Sleeping for {CHECK_INTERVAL} seconds...")
-                
-                # Sleep in small intervals to allow for graceful shutdown
-                for _ in range(CHECK_INTERVAL):
-                    if not monitoring_active:
-                        break
-                    time.sleep(1)
+    while not _stop_event.is_set():
+        check_count += 1
+        _log_check_started(check_count)
         
+        try:
+            result, error = process_all_transactions(USER_ID), None
         except KeyboardInterrupt:
-            print("\n\n⚠️ Monitoring stopped by user")
-            monitoring_active = False
+            logger.warning("\n\n⚠️ Monitoring stopped by user")
+            _stop_event.set()
             break
         except Exception as e:
-            print(f"\n❌ Error during monitoring: {e}")
-            print("⏳ Will retry in next cycle...")
-            time.sleep(60)  # Wait 1 minute before retry on error
+            result, error = None, e
+        
+        delay, backoff = _after_check(result, error, backoff)
+        
+        # Returns early as soon as stop_monitoring() is called
+        _stop_event.wait(delay)
+
+
+async def monitor_emails_async():
+    """
+    Check for new emails periodically as a task on the running event loop
+    
+    The blocking pipeline runs in a worker thread; cancel the task to stop
+    monitoring.
+    """
+    _log_started()
+    
+    check_count = 0
+    backoff = 1
+    
+    while True:
+        check_count += 1
+        _log_check_started(check_count)
+        
+        # Process transactions in a worker thread, after any fetch
+        # already running for this user
+        try:
+            result, error = await process_all_transactions_async(USER_ID), None
+        except Exception as e:
+            result, error = None, e
+        
+        delay, backoff = _after_check(result, error, backoff)
+        await asyncio.sleep(delay)
 
 
 def start_monitoring_thread():
     """
     Start email monitoring in a background thread
     """
+    _stop_event.clear()
     monitor_thread = threading.Thread(target=monitor_emails, daemon=True)
     monitor_thread.start()
     return monitor_thread
@@ -93,22 +167,21 @@ def stop_monitoring():
     """
     Stop the email monitoring
     """
-    global monitoring_active
-    monitoring_active = False
-    print("\n🛑 Stopping email monitoring...")
+    _stop_event.set()
+    logger.info("\n🛑 Stopping email monitoring...")
 
 
 if __name__ == "__main__":
-    print("\n" + "="*60)
-    print("📧 AUTOMATIC EMAIL MONITOR")
-    print("="*60)
-    print("\nThis script will automatically check for new transaction emails")
-    print(f"and add them to your account every {CHECK_INTERVAL} seconds.")
-    print("\nPress Ctrl+C to stop monitoring.\n")
-    print("="*60)
+    logger.info("\n" + "="*60)
+    logger.info("📧 AUTOMATIC EMAIL MONITOR")
+    logger.info("="*60)
+    logger.info("\nThis script will automatically check for new transaction emails")
+    logger.info(f"and add them to your account every {CHECK_INTERVAL} seconds.")
+    logger.info("\nPress Ctrl+C to stop monitoring.\n")
+    logger.info("="*60)
     
     try:
         monitor_emails()
     except KeyboardInterrupt:
-        print("\n\n✅ Monitoring stopped successfully")
-        print("="*60 + "\n")
+        logger.info("\n\n✅ Monitoring stopped successfully")
+        logger.info("="*60 + "\n")
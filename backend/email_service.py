@@ -4,44 +4,89 @@ Handles all Gmail API interactions for fetching transaction emails
 """
 
 import os
+import re
 import base64
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Tuple
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 from google.auth.transport.requests import Request
+from logger import get_logger
 
 
+logger = get_logger('email')
+
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 CLIENT_SECRETS_FILE = 'zyura_secret.json'
 
+# Email bodies are truncated to this many characters
+BODY_CHAR_LIMIT = 1000
+
+# Gmail accepts at most 100 calls per batch request
+GMAIL_BATCH_LIMIT = 100
+
+# Worker threads for the per-message fallback when a batch call fails
+GMAIL_FETCH_WORKERS = 10
+
+# Retries for Gmail calls; googleapiclient backs off exponentially with
+# jitter on 429 and 5xx responses
+GMAIL_NUM_RETRIES = 4
+
+# Statuses worth retrying when a call inside a batch fails
+_RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# messages.get() arguments: the whole message, or just its Subject header
+_FULL_MESSAGE = {'format': 'full'}
+_SUBJECT_ONLY = {'format': 'metadata', 'metadataHeaders': ['Subject']}
+
+# Subject keywords of transaction emails (mirrors the Gmail search query)
+_TRANSACTION_SUBJECT_RE = re.compile(r'transaction|payment|spent|debited|credited|bank alert', re.IGNORECASE)
+
+# Last built search query, keyed on (day, days_back); rebuilt when the day changes
+_query_cache = {'key': None, 'query': None}
+
+# Built Gmail service and its credentials, reused while the credentials are valid
+_service_cache = {'svc': None, 'creds': None}
+
 
 def setup_gmail_service():
     """
     Load Gmail credentials and setup service
     
+    The service is cached and returned as-is while its credentials are
+    valid, so repeated calls skip token.json and the discovery build.
+    
     Returns:
         Gmail service object or None if failed
     """
+    cached_creds = _service_cache['creds']
+    if _service_cache['svc'] is not None and cached_creds is not None and cached_creds.valid:
+        return _service_cache['svc']
+    
     creds = None
     
     try:
         # Step 1: Load existing token if available
         if os.path.exists('token.json'):
             creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-            print("✅ Loaded existing credentials from token.json")
+            logger.info("✅ Loaded existing credentials from token.json")
         
         # Step 2: If no valid creds, run OAuth flow
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
-                print("♻️ Refreshing expired token...")
+                logger.info("♻️ Refreshing expired token...")
                 creds.refresh(Request())
             else:
-                print("🌐 No valid token found, running OAuth flow...")
+                logger.info("🌐 No valid token found, running OAuth flow...")
                 
                 if not os.path.exists(CLIENT_SECRETS_FILE):
-                    print(f"❌ ERROR: {CLIENT_SECRETS_FILE} not found!")
+                    logger.error(f"❌ ERROR: {CLIENT_SECRETS_FILE} not found!")
                     return None
                 
                 flow = InstalledAppFlow.from_client_secrets_file(
@@ -51,28 +96,82 @@ def setup_gmail_service():
                 
                 # Run local server for OAuth
                 port = 8080
-                print(f"🚀 Starting local OAuth server on http://localhost:{port}/ ...")
+                logger.info(f"🚀 Starting local OAuth server on http://localhost:{port}/ ...")
                 creds = flow.run_local_server(port=port)
-                print(f"🛑 Local OAuth server on port {port} stopped successfully.")
-                print("✅ Authentication successful, credentials obtained.")
+                logger.info(f"🛑 Local OAuth server on port {port} stopped successfully.")
+                logger.info("✅ Authentication successful, credentials obtained.")
                 
                 # Save credentials for future runs
                 with open('token.json', 'w') as f:
                     f.write(creds.to_json())
-                print("💾 Credentials saved to token.json")
+                logger.info("💾 Credentials saved to token.json")
         
         # Step 3: Connect to Gmail API
-        print("🔗 Connecting to Gmail API...")
-        service = build('gmail', 'v1', credentials=creds)
-        print("✅ Gmail API connection established!")
+        logger.info("🔗 Connecting to Gmail API...")
+        # static_discovery: use the discovery document bundled with the
+        # client library instead of fetching it over HTTPS
+        service = build('gmail', 'v1', credentials=creds, static_discovery=True)
+        _service_cache['svc'] = service
+        _service_cache['creds'] = creds
+        logger.info("✅ Gmail API connection established!")
         
         return service
         
     except Exception as e:
-        print(f"❌ Error setting up Gmail service: {e}")
+        logger.error(f"❌ Error setting up Gmail service: {e}")
         return None
 
 
+def _find_plaintext_data(payload: Dict) -> Optional[str]:
+    """Return the base64 data of the first text/plain part, searching nested parts"""
+    for part in payload.get('parts', []):
+        if part.get('mimeType') == 'text/plain':
+            data = part.get('body', {}).get('data')
+            if data:
+                return data
+        # multipart/alternative inside multipart/mixed, etc.
+        elif 'parts' in part:
+            data = _find_plaintext_data(part)
+            if data:
+                return data
+    return None
+
+
+def _extract_plaintext(payload: Dict) -> str:
+    """
+    Extract plain text body from an already-fetched message payload
+    
+    Args:
+        payload: 'payload' field of a Gmail message (format='full')
+    
+    Returns:
+        Email body text (limited to 1000 chars)
+    """
+    # Handle simple text email
+    if 'body' in payload and payload['body'].get('data'):
+        data = payload['body']['data']
+    
+    # Handle multipart email, at any nesting depth
+    else:
+        data = _find_plaintext_data(payload)
+    
+    if not data:
+        return ""
+    
+    # Limit to 1000 characters. UTF-8 needs at most 4 bytes per character,
+    # so decode just the base64 prefix covering 4000 bytes; base64 decodes
+    # cleanly at any 4-character boundary.
+    prefix_len = -(-BODY_CHAR_LIMIT * 4 // 3) * 4
+    if len(data) > prefix_len:
+        body_text = base64.urlsafe_b64decode(data[:prefix_len]).decode('utf-8', errors='ignore')
+        if len(body_text) >= BODY_CHAR_LIMIT:
+            return body_text[:BODY_CHAR_LIMIT]
+    
+    # Short body, or so many invalid bytes that the prefix fell short
+    body_text = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+    return body_text[:BODY_CHAR_LIMIT]
+
+
 def get_email_body(service, message_id: str) -> str:
     """
     Extract plain text body from an email message
@@ -89,120 +188,377 @@ def get_email_body(service, message_id: str) -> str:
             userId='me',
             id=message_id,
             format='full'
-        ).execute()
-        
-        payload = msg.get('payload', {})
-        body_text = ""
+        ).execute(num_retries=GMAIL_NUM_RETRIES)
         
-        # Handle simple text email
-        if 'body' in payload and payload['body'].get('data'):
-            body_text = base64.urlsafe_b64decode(
-                payload['body']['data']
-            ).decode('utf-8', errors='ignore')
+        return _extract_plaintext(msg.get('payload', {}))
         
-        # Handle multipart email
-        elif 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    data = part['body'].get('data')
-                    if data:
-                        body_text = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                        break
+    except Exception as e:
+        logger.warning(f"⚠️ Error extracting email body: {e}")
+        return ""
+
+
+def _parse_message(msg_detail: Dict) -> Dict:
+    """
+    Build an email dictionary from a fetched Gmail message
+    
+    Args:
+        msg_detail: Message resource fetched with format='full' (or
+            format='metadata', which leaves the body empty)
+    
+    Returns:
+        Email dictionary with keys: message_id, subject, body, sender, date
+    """
+    payload = msg_detail['payload']
+    headers = payload['headers']
+    
+    # Extract headers
+    subject = next(
+        (h['value'] for h in headers if h['name'].lower() == 'subject'),
+        "(No Subject)"
+    )
+    sender = next(
+        (h['value'] for h in headers if h['name'].lower() == 'from'),
+        "(No Sender)"
+    )
+    date = next(
+        (h['value'] for h in headers if h['name'].lower() == 'date'),
+        ""
+    )
+    
+    return {
+        "message_id": msg_detail['id'],
+        "subject": subject,
+        "body": _extract_plaintext(payload),
+        "sender": sender,
+        "date": date
+    }
+
+
+def _is_gone(error: Exception) -> bool:
+    """True if a message fetch failed because the message no longer exists"""
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
+def _try_parse_message(msg_detail: Dict) -> Optional[Dict]:
+    """Parse a fetched message, logging and skipping it if it's malformed"""
+    try:
+        return _parse_message(msg_detail)
+    except Exception as e:
+        logger.warning(f"⚠️ Error processing email {msg_detail.get('id')}: {e}")
+        return None
+
+
+def _fetch_messages_parallel(service, message_ids: List[str], params: Dict) -> Tuple[Dict[str, Dict], List[str]]:
+    """
+    Fetch messages with concurrent individual get() calls
+    
+    httplib2 clients aren't thread-safe, so each worker thread gets its own
+    authorized HTTP object.
+    
+    Args:
+        service: Gmail service object
+        message_ids: Gmail message IDs to fetch
+        params: messages.get() arguments (_FULL_MESSAGE or _SUBJECT_ONLY)
+    
+    Returns:
+        Tuple of (parsed email dictionaries keyed by message ID, IDs that
+        couldn't be fetched)
+    """
+    local = threading.local()
+    
+    def fetch(message_id: str) -> Dict:
+        if not hasattr(local, 'http'):
+            creds = _service_cache['creds']
+            local.http = AuthorizedHttp(creds, http=build_http()) if creds else None
+        return service.users().messages().get(
+            userId='me',
+            id=message_id,
+            **params
+        ).execute(http=local.http, num_retries=GMAIL_NUM_RETRIES)
+    
+    parsed = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=min(GMAIL_FETCH_WORKERS, len(message_ids))) as executor:
+        futures = {executor.submit(fetch, message_id): message_id for message_id in message_ids}
+        for future in as_completed(futures):
+            message_id = futures[future]
+            try:
+                msg_detail = future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ Error fetching email {message_id}: {e}")
+                if not _is_gone(e):
+                    failed.append(message_id)
+                continue
+            
+            email = _try_parse_message(msg_detail)
+            if email:
+                parsed[message_id] = email
+    
+    return parsed, failed
+
+
+def _fetch_messages(service, message_ids: List[str], params: Dict = _FULL_MESSAGE) -> Tuple[List[Dict], List[str]]:
+    """
+    Fetch and parse messages in batched HTTP calls
+    
+    Messages the batch couldn't return because of rate limiting or server
+    errors, or all of them if the batch call itself fails, are retried
+    with concurrent individual requests.
+    
+    Args:
+        service: Gmail service object
+        message_ids: Gmail message IDs to fetch
+        params: messages.get() arguments (_FULL_MESSAGE or _SUBJECT_ONLY)
+    
+    Returns:
+        Tuple of (email dictionaries in the order of message_ids, IDs that
+        couldn't be fetched). Deleted and malformed messages are in neither.
+    """
+    parsed = {}
+    answered = set()
+    failed = []
+    
+    def on_message(request_id, response, exception):
+        if exception is not None:
+            if isinstance(exception, HttpError) and exception.resp.status in _RETRYABLE_STATUSES:
+                return  # left for the individual retry pass
+            answered.add(request_id)
+            logger.warning(f"⚠️ Error fetching email {request_id}: {exception}")
+            if not _is_gone(exception):
+                failed.append(request_id)
+            return
+        answered.add(request_id)
+        email = _try_parse_message(response)
+        if email:
+            parsed[request_id] = email
+    
+    try:
+        for start in range(0, len(message_ids), GMAIL_BATCH_LIMIT):
+            batch = service.new_batch_http_request(callback=on_message)
+            for message_id in message_ids[start:start + GMAIL_BATCH_LIMIT]:
+                batch.add(
+                    service.users().messages().get(userId='me', id=message_id, **params),
+                    request_id=message_id
+                )
+            batch.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Batch fetch failed: {e}")
+    
+    remaining = [message_id for message_id in message_ids if message_id not in answered]
+    if remaining:
+        logger.info(f"🔁 Fetching {len(remaining)} emails individually...")
+        retried, retry_failed = _fetch_messages_parallel(service, remaining, params)
+        parsed.update(retried)
+        failed.extend(retry_failed)
+    
+    return [parsed[message_id] for message_id in message_ids if message_id in parsed], failed
+
+
+def get_current_history_id() -> Optional[str]:
+    """
+    Get the mailbox's current historyId, the starting point for incremental syncs
+    
+    Returns:
+        historyId string, or None if it couldn't be fetched
+    """
+    service = setup_gmail_service()
+    if not service:
+        return None
+    
+    try:
+        profile = service.users().getProfile(userId='me').execute(num_retries=GMAIL_NUM_RETRIES)
+        return str(profile['historyId'])
+    except Exception as e:
+        logger.warning(f"⚠️ Error fetching Gmail historyId: {e}")
+        return None
+
+
+def list_new_message_ids(history_id: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    List messages added to the inbox after a known historyId
+    
+    Args:
+        history_id: historyId saved from a previous sync
+    
+    Returns:
+        Tuple of (message IDs, newest first; latest historyId). The ID list
+        is None when Gmail no longer has history that far back and a full
+        query is needed.
+    """
+    service = setup_gmail_service()
+    if not service:
+        logger.error("❌ Failed to setup Gmail service")
+        return [], history_id
+    
+    try:
+        message_ids = []
+        latest_history_id = history_id
+        page_token = None
         
-        # Limit to 1000 characters
-        return body_text[:1000] if body_text else ""
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX',
+                pageToken=page_token
+            ).execute(num_retries=GMAIL_NUM_RETRIES)
+            
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_ids.append(added['message']['id'])
+            
+            latest_history_id = str(response.get('historyId', latest_history_id))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
         
+    except HttpError as e:
+        if e.resp.status == 404:
+            logger.info("♻️ Gmail history expired, falling back to full query")
+            return None, None
+        logger.error(f"❌ Error fetching Gmail history: {e}")
+        return [], history_id
     except Exception as e:
-        print(f"⚠️ Error extracting email body: {e}")
-        return ""
+        logger.error(f"❌ Error fetching Gmail history: {e}")
+        return [], history_id
+    
+    if not message_ids:
+        logger.info("📭 No new emails since last check")
+    
+    # History lists oldest first; keep the newest-first order of the full query
+    return list(dict.fromkeys(reversed(message_ids))), latest_history_id
 
 
-def fetch_transaction_emails(num_emails: int = 3, days_back: int = 30) -> List[Dict]:
+def fetch_transaction_emails_by_id(message_ids: List[str]) -> Tuple[List[Dict], List[str]]:
     """
-    Query Gmail API for transaction-related emails
+    Fetch the transaction emails among a list of messages
+    
+    Only the Subject header is fetched for every message; full messages are
+    downloaded just for subjects that look like transaction alerts.
+    
+    Args:
+        message_ids: Gmail message IDs to check
+    
+    Returns:
+        Tuple of (email dictionaries in the order of message_ids, IDs that
+        couldn't be fetched and should be retried later)
+    """
+    if not message_ids:
+        return [], []
+    
+    service = setup_gmail_service()
+    if not service:
+        logger.error("❌ Failed to setup Gmail service")
+        return [], list(message_ids)
+    
+    logger.info(f"📨 Checking {len(message_ids)} emails, extracting details...")
+    
+    headers, failed = _fetch_messages(service, message_ids, _SUBJECT_ONLY)
+    matching = [
+        email['message_id'] for email in headers
+        if _TRANSACTION_SUBJECT_RE.search(email['subject'])
+    ]
+    
+    emails = []
+    if matching:
+        emails, failed_full = _fetch_messages(service, matching)
+        failed.extend(failed_full)
+    
+    logger.info(f"✅ Successfully extracted {len(emails)} transaction emails")
+    return emails, failed
+
+
+def _build_transaction_query(days_back: int) -> str:
+    """
+    Get the Gmail search query for transaction emails
+    
+    The query only changes once a day, so it's cached and stays byte-identical
+    between monitor ticks.
     
     Args:
-        num_emails: Maximum number of emails to fetch
         days_back: Number of days to look back
     
     Returns:
-        List of email dictionaries with keys: message_id, subject, body, sender, date
+        Gmail search query string
+    """
+    key = (date.today(), days_back)
+    if _query_cache['key'] != key:
+        after_timestamp = (key[0] - timedelta(days=days_back)).strftime('%Y/%m/%d')
+        _query_cache['query'] = (
+            f'subject:(transaction OR payment OR spent OR debited OR credited OR "bank alert") '
+            f'after:{after_timestamp}'
+        )
+        _query_cache['key'] = key
+    return _query_cache['query']
+
+
+def search_transaction_message_ids(num_emails: int = 3, days_back: int = 30) -> List[str]:
+    """
+    Search Gmail for transaction-related emails
+    
+    Args:
+        num_emails: Maximum number of emails to find
+        days_back: Number of days to look back
+    
+    Returns:
+        Message IDs, newest first
     """
     try:
         service = setup_gmail_service()
         if not service:
-            print("❌ Failed to setup Gmail service")
+            logger.error("❌ Failed to setup Gmail service")
             return []
         
-        # Calculate timestamp for days_back
-        after_date = datetime.now() - timedelta(days=days_back)
-        after_timestamp = after_date.strftime('%Y/%m/%d')
-        
         # Gmail query: filter for transaction keywords
-        query = f'subject:(transaction OR payment OR spent OR debited OR credited OR "bank alert") after:{after_timestamp}'
+        query = _build_transaction_query(days_back)
         
-        print(f"📬 Fetching transaction emails (last {days_back} days, max {num_emails})...")
-        print(f"🔍 Query: {query}")
+        logger.info(f"📬 Fetching transaction emails (last {days_back} days, max {num_emails})...")
+        logger.info(f"🔍 Query: {query}")
         
         # Fetch message list
         results = service.users().messages().list(
             userId='me',
             q=query,
             maxResults=num_emails
-        ).execute()
+        ).execute(num_retries=GMAIL_NUM_RETRIES)
         
         messages = results.get('messages', [])
         
         if not messages:
-            print("📭 No transaction emails found")
+            logger.info("📭 No transaction emails found")
             return []
         
-        print(f"📨 Found {len(messages)} emails, extracting details...")
+        logger.info(f"📨 Found {len(messages)} emails")
+        return [msg['id'] for msg in messages]
         
-        email_list = []
-        
-        for msg in messages:
-            try:
-                msg_detail = service.users().messages().get(
-                    userId='me',
-                    id=msg['id'],
-                    format='full'
-                ).execute()
-                
-                headers = msg_detail['payload']['headers']
-                
-                # Extract headers
-                subject = next(
-                    (h['value'] for h in headers if h['name'].lower() == 'subject'),
-                    "(No Subject)"
-                )
-                sender = next(
-                    (h['value'] for h in headers if h['name'].lower() == 'from'),
-                    "(No Sender)"
-                )
-                date = next(
-                    (h['value'] for h in headers if h['name'].lower() == 'date'),
-                    ""
-                )
-                
-                # Extract body
-                body = get_email_body(service, msg['id'])
-                
-                email_list.append({
-                    "message_id": msg['id'],
-                    "subject": subject,
-                    "body": body,
-                    "sender": sender,
-                    "date": date
-                })
-                
-            except Exception as e:
-                print(f"⚠️ Error processing email {msg['id']}: {e}")
-                continue
+    except Exception as e:
+        logger.error(f"❌ Error fetching emails: {e}")
+        return []
+
+
+def fetch_transaction_emails(num_emails: int = 3, days_back: int = 30) -> List[Dict]:
+    """
+    Query Gmail API for transaction-related emails
+    
+    Args:
+        num_emails: Maximum number of emails to fetch
+        days_back: Number of days to look back
+    
+    Returns:
+        List of email dictionaries with keys: message_id, subject, body, sender, date
+    """
+    message_ids = search_transaction_message_ids(num_emails, days_back)
+    if not message_ids:
+        return []
+    
+    try:
+        # The query already matched on subject, so fetch full messages directly
+        email_list, _ = _fetch_messages(setup_gmail_service(), message_ids)
         
-        print(f"✅ Successfully extracted {len(email_list)} emails")
+        logger.info(f"✅ Successfully extracted {len(email_list)} emails")
         return email_list
         
     except Exception as e:
-        print(f"❌ Error fetching emails: {e}")
+        logger.error(f"❌ Error fetching emails: {e}")
         return []
@@ -0,0 +1,66 @@
+"""
+Logging Module - Queue-Backed Loggers
+Records are queued by the calling thread and written to stdout by a
+background listener, so request handlers and the email monitor never block
+on console I/O
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+_LOG_QUEUE = queue.Queue(-1)
+_listener = None
+_lock = threading.Lock()
+
+
+def _level_from_env() -> int:
+    """Read LOG_LEVEL, falling back to INFO when it isn't a known level name"""
+    name = (os.getenv("LOG_LEVEL") or "INFO").upper()
+    level = logging.getLevelName(name)
+    if isinstance(level, int):
+        return level
+    
+    print(f"⚠️ Unknown LOG_LEVEL '{name}', using INFO")
+    return logging.INFO
+
+
+def _configure():
+    """Attach the queue handler to the 'splitmint' logger and start the listener once"""
+    global _listener
+    
+    with _lock:
+        if _listener is not None:
+            return
+        
+        # Messages already carry their own emoji/level markers
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+        
+        _listener = QueueListener(_LOG_QUEUE, stream_handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+        
+        base = logging.getLogger("splitmint")
+        base.addHandler(QueueHandler(_LOG_QUEUE))
+        base.setLevel(_level_from_env())
+        base.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a logger in the 'splitmint' namespace
+    
+    Args:
+        name: Component name, e.g. 'monitor' -> 'splitmint.monitor'
+    
+    Returns:
+        Logger whose records are written by the background listener
+    """
+    _configure()
+    return logging.getLogger(f"splitmint.{name}")
@@ -3,11 +3,16 @@ SplitMint FastAPI Server
 Main backend server for expense tracking and transaction management
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
+from logger import get_logger
 from datetime import datetime
+import asyncio
 import os
+from collections import Counter
 
 # Import models
 from models import (
@@ -26,11 +31,14 @@ from models import (
 # Import database functions
 from db import (
     connect_db,
+    close_db,
     insert_transaction,
     get_transactions,
+    TRANSACTION_FIELDS,
     update_budget,
-    get_budget,
+    get_budget_with_spent,
     get_all_transactions_by_month,
+    get_spending_by_category_from_db,
     delete_transaction,
     create_or_update_split,
     get_split_by_transaction,
@@ -39,7 +47,7 @@ from db import (
 )
 
 # Import processing pipeline
-from process_transactions import process_all_transactions
+from process_transactions import process_all_transactions_async
 
 # Import categorizer for validation
 from categorizer import get_valid_categories
@@ -47,92 +55,103 @@ from categorizer import get_valid_categories
 # Load environment variables
 load_dotenv()
 
-# Create FastAPI app
-app = FastAPI(
-    title="SplitMint",
-    version="1.0",
-    description="Expense tracker backend with Gmail integration and AI categorization"
-)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify actual origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = get_logger('api')
 
-# Email monitoring thread
-email_monitor_thread = None
+# Category names for O(1) membership checks in request handlers
+VALID_CATEGORIES = frozenset(get_valid_categories())
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database connection and start email monitoring on startup"""
-    global email_monitor_thread
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to the database and start email monitoring for the server's lifetime"""
+    app.state.monitor_task = None
     
-    print("\n" + "="*60)
-    print("🚀 SplitMint FastAPI Server Starting...")
-    print("="*60 + "\n")
+    logger.info("\n" + "="*60)
+    logger.info("🚀 SplitMint FastAPI Server Starting...")
+    logger.info("="*60 + "\n")
     
     # Connect to database
     if connect_db():
-        print("\n✅ Database connected successfully")
+        logger.info("\n✅ Database connected successfully")
     else:
-        print("\n❌ WARNING: Database connection failed")
+        logger.error("\n❌ WARNING: Database connection failed")
     
     # Start email monitoring
     auto_monitor = os.getenv("AUTO_MONITOR_EMAILS", "true").lower() == "true"
     
     if auto_monitor:
-        print("\n📧 Starting automatic email monitoring...")
-        from email_monitor import start_monitoring_thread
-        email_monitor_thread = start_monitoring_thread()
-        print("✅ Email monitoring started (checks every 45 seconds, fetches 3 latest emails)")
+        logger.info("\n📧 Starting automatic email monitoring...")
+        from email_monitor import monitor_emails_async
+        app.state.monitor_task = asyncio.create_task(monitor_emails_async())
+        logger.info("✅ Email monitoring started (checks every 45 seconds, fetches 3 latest emails)")
     else:
-        print("\n⏸️ Automatic email monitoring disabled (set AUTO_MONITOR_EMAILS=true to enable)")
+        logger.info("\n⏸️ Automatic email monitoring disabled (set AUTO_MONITOR_EMAILS=true to enable)")
     
-    print("\n" + "="*60)
-    print("📍 Available Endpoints:")
-    print("="*60)
-    print("GET    /health                      - Health check")
-    print("GET    /api/transactions            - Get user transactions")
-    print("GET    /api/budget                  - Get user budget")
-    print("GET    /api/spending-by-category    - Get category breakdown")
-    print("POST   /api/fetch-transactions      - Fetch from Gmail")
-    print("POST   /api/update-budget           - Update budget")
-    print("POST   /api/add-transaction         - Add manual transaction")
-    print("DELETE /api/delete-transaction      - Delete a transaction")
-    print("="*60 + "\n")
+    logger.info("\n" + "="*60)
+    logger.info("📍 Available Endpoints:")
+    logger.info("="*60)
+    logger.info("GET    /health                      - Health check")
+    logger.info("GET    /api/transactions            - Get user transactions")
+    logger.info("GET    /api/budget                  - Get user budget")
+    logger.info("GET    /api/spending-by-category    - Get category breakdown")
+    logger.info("POST   /api/fetch-transactions      - Fetch from Gmail")
+    logger.info("POST   /api/update-budget           - Update budget")
+    logger.info("POST   /api/add-transaction         - Add manual transaction")
+    logger.info("DELETE /api/delete-transaction      - Delete a transaction")
+    logger.info("="*60 + "\n")
     
     env = os.getenv("ENVIRONMENT", "development")
-    print(f"🌍 Environment: {env}")
-    print(f"🔗 Server running on http://localhost:8000")
-    print(f"📖 API Docs: http://localhost:8000/docs")
-    print(f"📘 ReDoc: http://localhost:8000/redoc")
-    print("\n" + "="*60 + "\n")
+    logger.info(f"🌍 Environment: {env}")
+    logger.info(f"🔗 Server running on http://localhost:8000")
+    logger.info(f"📖 API Docs: http://localhost:8000/docs")
+    logger.info(f"📘 ReDoc: http://localhost:8000/redoc")
+    logger.info("\n" + "="*60 + "\n")
+    
+    yield
+    
+    # Cleanup on server shutdown
+    monitor_task = app.state.monitor_task
+    
+    if monitor_task:
+        logger.info("\n🛑 Stopping email monitoring...")
+        monitor_task.cancel()
+        try:
+            await monitor_task
+        except asyncio.CancelledError:
+            pass
+        logger.info("✅ Email monitoring stopped")
+    
+    close_db()
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on server shutdown"""
-    global email_monitor_thread
-    
-    if email_monitor_thread:
-        print("\n🛑 Stopping email monitoring...")
-        from email_monitor import stop_monitoring
-        stop_monitoring()
-        print("✅ Email monitoring stopped")
+# Create FastAPI app
+app = FastAPI(
+    title="SplitMint",
+    version="1.0",
+    description="Expense tracker backend with Gmail integration and AI categorization",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson serializes large lists much faster
+)
+
+# Add CORS middleware with explicit lists, so Starlette can answer from
+# precomputed headers instead of echoing each request's values
+cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[origin.strip() for origin in cors_origins.split(",") if origin.strip()],
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
+)
 
 
 @app.get("/health")
 async def health_check():
     """Simple health check endpoint"""
-    global email_monitor_thread
-    
     auto_monitor_enabled = os.getenv("AUTO_MONITOR_EMAILS", "true").lower() == "true"
-    monitor_active = email_monitor_thread is not None and email_monitor_thread.is_alive()
+    monitor_task = getattr(app.state, "monitor_task", None)
+    monitor_active = monitor_task is not None and not monitor_task.done()
     
     return {
         "status": "ok",
@@ -155,10 +174,11 @@ async def fetch_transactions(request: FetchTransactionsRequest):
         ApiResponse with success status and count of new transactions
     """
     try:
-        print(f"\n📧 Fetching transactions for user: {request.user_id}")
+        logger.info(f"\n📧 Fetching transactions for user: {request.user_id}")
         
-        # Process all transactions
-        result = process_all_transactions(request.user_id)
+        # Process all transactions (Gmail + DB work, off the event loop);
+        # waits if the monitor or another request is already fetching
+        result = await process_all_transactions_async(request.user_id)
         
         return ApiResponse(
             success=result['success'],
@@ -167,7 +187,7 @@ async def fetch_transactions(request: FetchTransactionsRequest):
         )
         
     except Exception as e:
-        print(f"❌ Error in fetch_transactions: {e}")
+        logger.error(f"❌ Error in fetch_transactions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -193,7 +213,8 @@ async def update_budget_endpoint(request: UpdateBudgetRequest):
             )
         
         # Update budget in database
-        success = update_budget(
+        success = await asyncio.to_thread(
+            update_budget,
             user_id=request.user_id,
             income=request.income,
             budget=request.budget,
@@ -211,14 +232,16 @@ async def update_budget_endpoint(request: UpdateBudgetRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in update_budget: {e}")
+        logger.error(f"❌ Error in update_budget: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/transactions", response_model=ApiResponse)
 async def get_transactions_endpoint(
     user_id: str = Query(..., description="User identifier"),
-    month: str = Query(None, description="Filter by month (YYYY-MM)")
+    month: str = Query(None, description="Filter by month (YYYY-MM)"),
+    limit: int = Query(100, ge=1, le=500, description="Maximum transactions to return (ignored with month)"),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. _id,merchant,amount")
 ):
     """
     Get user's transactions, optionally filtered by month
@@ -226,11 +249,27 @@ async def get_transactions_endpoint(
     Args:
         user_id: User identifier
         month: Optional month filter (YYYY-MM)
+        limit: Maximum number of transactions when not filtering by month
+        fields: Optional comma-separated projection; amount is always included
     
     Returns:
         ApiResponse with transactions list and total_spent
     """
     try:
+        # Project only the requested fields on the server
+        projection = None
+        if fields:
+            projection = {f.strip() for f in fields.split(",") if f.strip()}
+            unknown = projection - TRANSACTION_FIELDS
+            if unknown:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(TRANSACTION_FIELDS))}"
+                )
+            # total_spent is computed from amount
+            projection.add("amount")
+            projection = sorted(projection)
+        
         # Fetch transactions
         if month:
             # Validate month format
@@ -242,9 +281,9 @@ async def get_transactions_endpoint(
                     detail="Invalid month format. Use YYYY-MM (e.g., 2025-10)"
                 )
             
-            transactions = get_all_transactions_by_month(user_id, month)
+            transactions = await asyncio.to_thread(get_all_transactions_by_month, user_id, month, projection)
         else:
-            transactions = get_transactions(user_id, limit=100)
+            transactions = await asyncio.to_thread(get_transactions, user_id, limit, projection)
         
         # Calculate total spent
         total_spent = sum(t['amount'] for t in transactions)
@@ -262,7 +301,7 @@ async def get_transactions_endpoint(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in get_transactions: {e}")
+        logger.error(f"❌ Error in get_transactions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -291,8 +330,8 @@ async def get_budget_endpoint(
                 detail="Invalid month format. Use YYYY-MM (e.g., 2025-10)"
             )
         
-        # Get budget
-        budget = get_budget(user_id, month)
+        # Get budget and the month's spending in one round trip
+        budget = await asyncio.to_thread(get_budget_with_spent, user_id, month)
         
         if not budget:
             raise HTTPException(
@@ -300,9 +339,7 @@ async def get_budget_endpoint(
                 detail=f"No budget found for user {user_id} in {month}"
             )
         
-        # Get all transactions for the month
-        transactions = get_all_transactions_by_month(user_id, month)
-        total_spent = sum(t['amount'] for t in transactions)
+        total_spent = float(budget['total_spent'])
         
         # Calculate remaining
         remaining = budget['budget'] - total_spent
@@ -324,7 +361,7 @@ async def get_budget_endpoint(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in get_budget: {e}")
+        logger.error(f"❌ Error in get_budget: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -341,11 +378,10 @@ async def add_transaction_endpoint(request: AddTransactionRequest):
     """
     try:
         # Validate category
-        valid_categories = get_valid_categories()
-        if request.category not in valid_categories:
+        if request.category not in VALID_CATEGORIES:
             raise HTTPException(
                 status_code=422,
-                detail=f"Invalid category. Must be one of: {', '.join(valid_categories)}"
+                detail=f"Invalid category. Must be one of: {', '.join(get_valid_categories())}"
             )
         
         # Validate date format
@@ -358,7 +394,8 @@ async def add_transaction_endpoint(request: AddTransactionRequest):
             )
         
         # Insert transaction
-        transaction_id = insert_transaction(
+        transaction_id = await asyncio.to_thread(
+            insert_transaction,
             user_id=request.user_id,
             merchant=request.merchant,
             amount=request.amount,
@@ -379,7 +416,7 @@ async def add_transaction_endpoint(request: AddTransactionRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in add_transaction: {e}")
+        logger.error(f"❌ Error in add_transaction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -408,33 +445,21 @@ async def get_spending_by_category(
                 detail="Invalid month format. Use YYYY-MM (e.g., 2025-01)"
             )
         
-        # Get all transactions for the month
-        all_transactions = get_all_transactions_by_month(user_id, month)
+        # Sum spending per category in the database
+        totals = await asyncio.to_thread(get_spending_by_category_from_db, user_id, month)
         
-        # Calculate spending by category
-        category_spending = {}
-        valid_categories = get_valid_categories()
-        
-        # Initialize all categories with 0
-        for category in valid_categories:
-            category_spending[category] = 0.0
-        
-        # Sum up amounts by category
-        for txn in all_transactions:
-            category = txn.get('category', 'Unknown')
-            amount = txn.get('amount', 0.0)
-            
-            if category in category_spending:
-                category_spending[category] += amount
-            else:
-                category_spending['Unknown'] += amount
+        # Calculate spending by category; unrecognized or missing
+        # categories are counted as Others
+        category_spending = Counter()
+        for category, amount in totals.items():
+            category_spending[category if category in VALID_CATEGORIES else 'Others'] += amount
         
         # Calculate total spending
         total_spending = sum(category_spending.values())
         
-        # Create response with percentages
+        # Create response with percentages, largest amount first
         breakdown = []
-        for category, amount in category_spending.items():
+        for category, amount in category_spending.most_common():
             if amount > 0:  # Only include categories with spending
                 percentage = (amount / total_spending * 100) if total_spending > 0 else 0
                 breakdown.append({
@@ -443,9 +468,6 @@ async def get_spending_by_category(
                     "percentage": round(percentage, 1)
                 })
         
-        # Sort by amount descending
-        breakdown.sort(key=lambda x: x['amount'], reverse=True)
-        
         return {
             "success": True,
             "data": {
@@ -458,7 +480,7 @@ async def get_spending_by_category(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in get_spending_by_category: {e}")
+        logger.error(f"❌ Error in get_spending_by_category: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -475,7 +497,7 @@ async def delete_transaction_endpoint(request: DeleteTransactionRequest):
     """
     try:
         # Delete the transaction
-        success = delete_transaction(request.transaction_id, request.user_id)
+        success = await asyncio.to_thread(delete_transaction, request.transaction_id, request.user_id)
         
         if success:
             return ApiResponse(
@@ -491,7 +513,7 @@ async def delete_transaction_endpoint(request: DeleteTransactionRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error in delete_transaction: {e}")
+        logger.error(f"❌ Error in delete_transaction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -499,7 +521,7 @@ async def delete_transaction_endpoint(request: DeleteTransactionRequest):
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Handle all unhandled exceptions"""
-    print(f"❌ Unhandled exception: {exc}")
+    logger.error(f"❌ Unhandled exception: {exc}")
     return {
         "success": False,
         "message": f"Internal server error: {str(exc)}",
@@ -530,11 +552,13 @@ async def create_split_endpoint(request: CreateSplitRequest):
                 detail=f"Invalid split method. Must be one of: {', '.join(valid_methods)}"
             )
         
-        # Convert participants to dict
-        participants_dict = [p.model_dump() for p in request.participants]
+        # Participants were validated on the way in; copy their fields
+        # without another serialization pass
+        participants_dict = [dict(p) for p in request.participants]
         
-        # Create or update split
-        split_id = create_or_update_split(
+        # Create or update split; the saved document comes straight back
+        split_data = await asyncio.to_thread(
+            create_or_update_split,
             user_id=request.user_id,
             transaction_id=request.transaction_id,
             participants=participants_dict,
@@ -542,10 +566,7 @@ async def create_split_endpoint(request: CreateSplitRequest):
             notes=request.notes
         )
         
-        if split_id:
-            # Get the created/updated split
-            split_data = get_split_by_transaction(request.user_id, request.transaction_id)
-            
+        if split_data:
             return ApiResponse(
                 success=True,
                 message="Split created/updated successfully",
@@ -557,9 +578,7 @@ async def create_split_endpoint(request: CreateSplitRequest):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"❌ Error in create_split_endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error in create_split_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 
@@ -569,7 +588,7 @@ async def get_split_endpoint(request: GetSplitRequest):
     Get split details for a transaction
     """
     try:
-        split_data = get_split_by_transaction(request.user_id, request.transaction_id)
+        split_data = await asyncio.to_thread(get_split_by_transaction, request.user_id, request.transaction_id)
         
         if split_data:
             return ApiResponse(
@@ -585,7 +604,7 @@ async def get_split_endpoint(request: GetSplitRequest):
             )
     
     except Exception as e:
-        print(f"❌ Error in get_split_endpoint: {e}")
+        logger.error(f"❌ Error in get_split_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 
@@ -595,7 +614,7 @@ async def delete_split_endpoint(request: DeleteSplitRequest):
     Delete a split transaction
     """
     try:
-        success = delete_split(request.user_id, request.transaction_id)
+        success = await asyncio.to_thread(delete_split, request.user_id, request.transaction_id)
         
         if success:
             return ApiResponse(
@@ -606,7 +625,7 @@ async def delete_split_endpoint(request: DeleteSplitRequest):
             raise HTTPException(status_code=404, detail="Split not found")
     
     except Exception as e:
-        print(f"❌ Error in delete_split_endpoint: {e}")
+        logger.error(f"❌ Error in delete_split_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 
@@ -616,7 +635,7 @@ async def get_all_splits_endpoint(user_id: str):
     Get all splits for a user
     """
     try:
-        splits = get_all_splits(user_id)
+        splits = await asyncio.to_thread(get_all_splits, user_id)
         
         return ApiResponse(
             success=True,
@@ -626,7 +645,7 @@ async def get_all_splits_endpoint(user_id: str):
         )
     
     except Exception as e:
-        print(f"❌ Error in get_all_splits_endpoint: {e}")
+        logger.error(f"❌ Error in get_all_splits_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 
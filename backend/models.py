@@ -2,17 +2,26 @@
 Pydantic Data Models for Request/Response Validation
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime
 from typing import Optional, List, Dict, Any
 
 
+# Request bodies are validated once on the way in and only read afterwards
+_REQUEST_CONFIG = ConfigDict(frozen=True)
+
+
 class FetchTransactionsRequest(BaseModel):
     """Request body for /api/fetch-transactions"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
 
 
 class UpdateBudgetRequest(BaseModel):
     """Request body for /api/update-budget"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     income: float = Field(..., gt=0, description="Monthly income (must be > 0)")
     budget: float = Field(..., gt=0, description="Monthly budget limit (must be > 0)")
@@ -28,7 +37,7 @@ class TransactionResponse(BaseModel):
     category: str
     date: str
     email_subject: Optional[str] = None
-    created_at: str
+    created_at: datetime
 
 
 class BudgetResponse(BaseModel):
@@ -42,6 +51,8 @@ class BudgetResponse(BaseModel):
 
 class AddTransactionRequest(BaseModel):
     """Request body for /api/add-transaction"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     merchant: str = Field(..., description="Merchant/store name")
     amount: float = Field(..., gt=0, description="Transaction amount (must be > 0)")
@@ -51,12 +62,16 @@ class AddTransactionRequest(BaseModel):
 
 class DeleteTransactionRequest(BaseModel):
     """Request body for /api/delete-transaction"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     transaction_id: str = Field(..., description="Transaction ID to delete")
 
 
 class DemoDataRequest(BaseModel):
     """Request body for /api/load-demo-data"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     month: str = Field(..., description="Month in format YYYY-MM (e.g., 2025-10)")
 
@@ -75,6 +90,8 @@ class ApiResponse(BaseModel):
 
 class SplitParticipant(BaseModel):
     """Model for a participant in a split transaction"""
+    model_config = _REQUEST_CONFIG
+    
     name: str = Field(..., description="Participant name")
     phone_number: Optional[str] = Field(None, description="Phone number for payment reminders")
     share_percentage: Optional[float] = Field(None, ge=0, le=100, description="Share as percentage (0-100)")
@@ -85,21 +102,27 @@ class SplitParticipant(BaseModel):
 
 class CreateSplitRequest(BaseModel):
     """Request body for creating/updating a split transaction"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     transaction_id: str = Field(..., description="Original transaction ID")
-    participants: List[SplitParticipant] = Field(..., min_items=2, description="List of participants (min 2)")
+    participants: List[SplitParticipant] = Field(..., min_length=2, description="List of participants (min 2)")
     split_method: str = Field(..., description="Split method: 'equal', 'percentage', or 'ratio'")
     notes: Optional[str] = Field(None, description="Optional notes about the split")
 
 
 class GetSplitRequest(BaseModel):
     """Request body for getting split details"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     transaction_id: str = Field(..., description="Transaction ID")
 
 
 class DeleteSplitRequest(BaseModel):
     """Request body for deleting a split"""
+    model_config = _REQUEST_CONFIG
+    
     user_id: str = Field(..., description="User identifier")
     transaction_id: str = Field(..., description="Transaction ID")
 
@@ -114,5 +137,5 @@ class SplitResponse(BaseModel):
     split_method: str
     participants: List[Dict[str, Any]]
     notes: Optional[str] = None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
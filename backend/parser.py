@@ -5,9 +5,38 @@ Uses regex patterns to identify merchant, amount, and date
 
 import re
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional, Dict, List
 
 
+# Currency amount such as "Rs. 450", "₹1,299.00" or "Rupees 500", shared by
+# every pattern that doesn't need its own amount context
+AMOUNT_RE = re.compile(r'(?:Rs\.?\s*|₹|Rupees\s+)\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE)
+
+# Text every amount pattern needs: a currency marker before a digit, or
+# "sent"/"transferred". Emails without it can't match any pattern set.
+_ANCHOR_RE = re.compile(r'(?:Rs\.?|₹|Rupees)\s*\d|(?:sent|transferred)\s', re.IGNORECASE)
+
+# Runs of whitespace inside a merchant name
+_WS_RE = re.compile(r'\s+')
+
+# Punctuation trimmed from both ends of a merchant name
+_TRAIL = '.,;:-'
+
+# Common date patterns, tried in order
+_DATE_PATTERNS = [
+    re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', re.IGNORECASE),  # DD/MM/YYYY or DD-MM-YYYY
+    re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', re.IGNORECASE),  # YYYY/MM/DD or YYYY-MM-DD
+    re.compile(r'(\d{1,2})\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{4})', re.IGNORECASE),  # DD Month YYYY
+]
+
+_MONTHS = {
+    'jan': '01', 'feb': '02', 'mar': '03', 'apr': '04',
+    'may': '05', 'jun': '06', 'jul': '07', 'aug': '08',
+    'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12'
+}
+
+
 def get_regex_patterns() -> List[Dict[str, re.Pattern]]:
     """
     Return list of compiled regex patterns for transaction extraction
@@ -19,14 +48,14 @@ def get_regex_patterns() -> List[Dict[str, re.Pattern]]:
         # Pattern 1: "Rs. 450 spent at Domino's" or "₹450 spent at Amazon"
         {
             'name': 'spent_at',
-            'amount': re.compile(r'(?:Rs\.?\s*|₹|Rupees\s+)\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+            'amount': AMOUNT_RE,
             'merchant': re.compile(r'(?:spent at|paid to|at)\s+([A-Za-z0-9\s&\'-]+?)(?:\s+(?:at|on|dated)|\.|$)', re.IGNORECASE)
         },
         
         # Pattern 2: "₹1299 debited to Amazon" or "Rs 1299 debited to Flipkart"
         {
             'name': 'debited_to',
-            'amount': re.compile(r'(?:Rs\.?\s*|₹|Rupees\s+)\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+            'amount': AMOUNT_RE,
             'merchant': re.compile(r'(?:debited to|credited to|to)\s+([A-Za-z0-9\s&\'-]+?)(?:\s+(?:at|on|dated)|\.|$)', re.IGNORECASE)
         },
         
@@ -47,7 +76,7 @@ def get_regex_patterns() -> List[Dict[str, re.Pattern]]:
         # Pattern 5: "₹649 to Netflix" or "Rs 649 at Starbucks"
         {
             'name': 'simple_to_at',
-            'amount': re.compile(r'(?:Rs\.?\s*|₹|Rupees\s+)\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+            'amount': AMOUNT_RE,
             'merchant': re.compile(r'(?:to|at|from)\s+([A-Za-z0-9\s&\'-]+?)(?:\s+(?:at|on|dated)|\.|$)', re.IGNORECASE)
         },
         
@@ -61,7 +90,7 @@ def get_regex_patterns() -> List[Dict[str, re.Pattern]]:
         # Pattern 7: Generic "Rs 500" or "₹500" or "Rupees 500" with merchant nearby
         {
             'name': 'generic',
-            'amount': re.compile(r'(?:Rs\.?\s*|₹|Rupees\s+)\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+            'amount': AMOUNT_RE,
             'merchant': re.compile(r'([A-Z][A-Za-z0-9\s&\'-]{2,30}?)(?:\s+(?:on|dated|transaction|at)|\.|$)', re.IGNORECASE)
         }
     ]
@@ -69,6 +98,10 @@ def get_regex_patterns() -> List[Dict[str, re.Pattern]]:
     return patterns
 
 
+# Compiled once at import and shared by every parse
+_PATTERNS = get_regex_patterns()
+
+
 def extract_date_from_text(text: str) -> str:
     """
     Extract date from email text, or return today's date
@@ -79,15 +112,13 @@ def extract_date_from_text(text: str) -> str:
     Returns:
         Date string in YYYY-MM-DD format
     """
-    # Common date patterns
-    date_patterns = [
-        r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})',  # DD/MM/YYYY or DD-MM-YYYY
-        r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})',  # YYYY/MM/DD or YYYY-MM-DD
-        r'(\d{1,2})\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+(\d{4})',  # DD Month YYYY
-    ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    return _find_date(text) or datetime.now().strftime('%Y-%m-%d')
+
+
+def _find_date(text: str) -> Optional[str]:
+    """Return the first date found in text as YYYY-MM-DD, or None"""
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(text)
         if match:
             try:
                 groups = match.groups()
@@ -104,19 +135,13 @@ def extract_date_from_text(text: str) -> str:
                         return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
                     else:
                         # DD Month YYYY format
-                        months = {
-                            'jan': '01', 'feb': '02', 'mar': '03', 'apr': '04',
-                            'may': '05', 'jun': '06', 'jul': '07', 'aug': '08',
-                            'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12'
-                        }
                         day, month_name, year = groups
-                        month = months.get(month_name.lower()[:3], '01')
+                        month = _MONTHS.get(month_name.lower()[:3], '01')
                         return f"{year}-{month}-{day.zfill(2)}"
             except:
                 pass
     
-    # Default to today's date
-    return datetime.now().strftime('%Y-%m-%d')
+    return None
 
 
 def parse_transaction_from_email(subject: str, body: str) -> Optional[Dict[str, any]]:
@@ -130,18 +155,52 @@ def parse_transaction_from_email(subject: str, body: str) -> Optional[Dict[str,
     Returns:
         Dictionary with merchant, amount, date or None if no transaction found
     """
+    parsed = _parse_transaction(subject, body)
+    if not parsed:
+        return None
+    
+    # Callers get their own copy of the cached result. Emails without a date
+    # are dated when parsed, not when first cached.
+    parsed = dict(parsed)
+    if parsed['date'] is None:
+        parsed['date'] = datetime.now().strftime('%Y-%m-%d')
+    return parsed
+
+
+# Resent alerts and forwarded copies repeat the same subject and body
+@lru_cache(maxsize=1024)
+def _parse_transaction(subject: str, body: str) -> Optional[Dict[str, any]]:
+    """
+    Parse one email; results are memoized by (subject, body)
+    
+    Args:
+        subject: Email subject line
+        body: Email body text
+    
+    Returns:
+        Dictionary with merchant, amount, date (None if the email has no
+        date) or None if no transaction found
+    """
     # Combine subject and body for parsing
     full_text = f"{subject} {body}"
     
-    patterns = get_regex_patterns()
+    # One scan rules out non-transaction emails before the pattern loop
+    if not _ANCHOR_RE.search(full_text):
+        return None
     
     merchant = None
     amount = None
     
+    # Several pattern sets share AMOUNT_RE; search the text with it once
+    amount_matches = {}
+    
     # Try each pattern until we find a match
-    for pattern_set in patterns:
+    for pattern_set in _PATTERNS:
         # Extract amount
-        amount_match = pattern_set['amount'].search(full_text)
+        amount_re = pattern_set['amount']
+        if amount_re not in amount_matches:
+            amount_matches[amount_re] = amount_re.search(full_text)
+        amount_match = amount_matches[amount_re]
         if amount_match:
             amount_str = amount_match.group(1).replace(',', '')
             try:
@@ -152,11 +211,8 @@ def parse_transaction_from_email(subject: str, body: str) -> Optional[Dict[str,
             # Extract merchant
             merchant_match = pattern_set['merchant'].search(full_text)
             if merchant_match:
-                merchant = merchant_match.group(1).strip()
-                
-                # Clean up merchant name
-                merchant = re.sub(r'\s+', ' ', merchant)  # Remove extra spaces
-                merchant = merchant.strip('.,;:-')  # Remove trailing punctuation
+                # Collapse extra spaces, then drop surrounding punctuation
+                merchant = _WS_RE.sub(' ', merchant_match.group(1).strip()).strip(_TRAIL)
                 
                 # If we found both, we're done
                 if merchant and amount:
@@ -166,8 +222,8 @@ def parse_transaction_from_email(subject: str, body: str) -> Optional[Dict[str,
     if not merchant or not amount:
         return None
     
-    # Extract date
-    date_str = extract_date_from_text(full_text)
+    # Extract date; the today fallback is applied by the caller so it isn't cached
+    date_str = _find_date(full_text)
     
     return {
         'merchant': merchant,
@@ -3,11 +3,75 @@ Process Transactions Module - Main Pipeline
 Orchestrates fetching, parsing, categorizing, and saving transactions
 """
 
-from typing import Dict
-from email_service import setup_gmail_service, fetch_transaction_emails
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional
+from email_service import (
+    setup_gmail_service,
+    search_transaction_message_ids,
+    list_new_message_ids,
+    fetch_transaction_emails_by_id,
+    get_current_history_id
+)
 from parser import parse_transaction_from_email
-from categorizer import categorize_merchant
-from db import check_duplicate_transaction, insert_transaction, connect_db
+from categorizer import categorize_merchant, categorize_merchants
+from logger import get_logger
+from db import (
+    check_duplicate_transaction,
+    find_existing_transactions,
+    insert_transaction,
+    insert_transactions_many,
+    connect_db,
+    get_gmail_sync_state,
+    save_gmail_sync_state
+)
+
+
+logger = get_logger('pipeline')
+
+# One pipeline run at a time per user, shared by the API endpoint and the
+# email monitor task, so they don't hit Gmail's per-user limits together
+_user_locks = defaultdict(asyncio.Lock)
+
+# Runs that may fail on the same email before it is dropped from the retry list
+MAX_MESSAGE_ATTEMPTS = 5
+
+
+def _save_sync_state(
+    user_id: str,
+    history_id: Optional[str],
+    new_history_id: Optional[str],
+    pending: Dict[str, int],
+    failed_ids: List[str]
+):
+    """
+    Record how far this run got through the mailbox
+    
+    The historyId always advances to the latest one seen. Messages that
+    couldn't be fetched or stored are kept as pending with their attempt
+    count and fetched by ID on the next run; after MAX_MESSAGE_ATTEMPTS
+    failed runs a message is dropped and logged.
+    
+    Args:
+        user_id: User identifier
+        history_id: historyId this run started from
+        new_history_id: Latest historyId seen by this run
+        pending: Pending message IDs this run retried, with their attempt counts
+        failed_ids: Message IDs this run couldn't fetch or store
+    """
+    retry = {}
+    for message_id in failed_ids:
+        attempts = pending.get(message_id, 0) + 1
+        if attempts >= MAX_MESSAGE_ATTEMPTS:
+            logger.error(f"❌ Giving up on email {message_id} after {attempts} failed attempts")
+        else:
+            retry[message_id] = attempts
+    
+    if retry:
+        logger.warning(f"⚠️ {len(retry)} emails will be retried next sync")
+    
+    if retry or pending or (new_history_id and new_history_id != history_id):
+        save_gmail_sync_state(user_id, new_history_id, retry)
 
 
 def process_single_transaction(user_id: str, subject: str, body: str) -> Dict:
@@ -63,7 +127,7 @@ def process_single_transaction(user_id: str, subject: str, body: str) -> Dict:
         return None
         
     except Exception as e:
-        print(f"❌ Error processing single transaction: {e}")
+        logger.error(f"❌ Error processing single transaction: {e}")
         return None
 
 
@@ -77,9 +141,9 @@ def process_all_transactions(user_id: str) -> Dict:
     Returns:
         Dictionary with processing summary: {success, total_new, total_failed, message}
     """
-    print(f"\n{'='*60}")
-    print(f"🚀 Starting transaction processing for user: {user_id}")
-    print(f"{'='*60}\n")
+    logger.info("\n" + "="*60)
+    logger.info(f"🚀 Starting transaction processing for user: {user_id}")
+    logger.info("="*60 + "\n")
     
     # Track statistics
     total_processed = 0
@@ -90,7 +154,7 @@ def process_all_transactions(user_id: str) -> Dict:
     
     try:
         # Step 0: Connect to database
-        print("🔗 Step 0: Connecting to database...")
+        logger.info("🔗 Step 0: Connecting to database...")
         if not connect_db():
             return {
                 'success': False,
@@ -98,10 +162,10 @@ def process_all_transactions(user_id: str) -> Dict:
                 'total_failed': 0,
                 'message': 'Failed to connect to database'
             }
-        print("✅ Database connected\n")
+        logger.info("✅ Database connected\n")
         
         # Step 1: Setup Gmail service
-        print("📧 Step 1: Setting up Gmail service...")
+        logger.info("📧 Step 1: Setting up Gmail service...")
         service = setup_gmail_service()
         if not service:
             return {
@@ -111,89 +175,128 @@ def process_all_transactions(user_id: str) -> Dict:
                 'message': 'Failed to setup Gmail service'
             }
         
-        # Step 2: Fetch transaction emails (latest 3 emails)
-        print("\n📬 Step 2: Fetching transaction emails...")
-        emails = fetch_transaction_emails(num_emails=3, days_back=30)
+        # Step 2: Fetch transaction emails. After the first sync only mail
+        # added since the saved historyId is fetched.
+        logger.info("\n📬 Step 2: Fetching transaction emails...")
+        message_ids = None
+        history_id, pending = get_gmail_sync_state(user_id)
+        
+        if history_id:
+            message_ids, new_history_id = list_new_message_ids(history_id)
+        
+        if message_ids is None:
+            # First sync or expired history: run the keyword query (latest 3
+            # emails). Take the historyId first so nothing slips in between.
+            new_history_id = get_current_history_id()
+            message_ids = search_transaction_message_ids(num_emails=3, days_back=30)
+        
+        # Messages an earlier run couldn't fetch or store are tried again
+        if pending:
+            logger.info(f"🔁 Retrying {len(pending)} emails from earlier syncs")
+            message_ids = list(dict.fromkeys(message_ids + list(pending)))
+        
+        # Subjects are checked first; only transaction emails are downloaded
+        emails, failed_ids = fetch_transaction_emails_by_id(message_ids)
+        total_failed += len(failed_ids)
         
         if not emails:
+            _save_sync_state(user_id, history_id, new_history_id, pending, failed_ids)
             return {
                 'success': True,
                 'total_new': 0,
-                'total_failed': 0,
+                'total_failed': total_failed,
                 'message': 'No transaction emails found'
             }
         
         total_processed = len(emails)
-        print(f"✅ Retrieved {total_processed} emails\n")
+        logger.info(f"✅ Retrieved {total_processed} emails\n")
         
-        # Step 3: Process each email
-        print("🔄 Step 3: Processing emails...\n")
+        # Step 3: Parse each email
+        logger.info("🔄 Step 3: Processing emails...\n")
         
+        parsed_emails = []
         for i, email in enumerate(emails, 1):
             try:
-                print(f"Processing email {i}/{total_processed}...")
-                print(f"  Subject: {email['subject'][:60]}...")
+                logger.info(f"Processing email {i}/{total_processed}...")
+                logger.info(f"  Subject: {email['subject'][:60]}...")
                 
                 # Parse transaction
                 parsed = parse_transaction_from_email(email['subject'], email['body'])
                 
                 if not parsed:
-                    print(f"  ⚠️ No transaction found, skipping")
+                    logger.info("  ⚠️ No transaction found, skipping\n")
                     total_failed += 1
                     continue
                 
                 total_parsed += 1
-                print(f"  ✓ Parsed: {parsed['merchant']} - ₹{parsed['amount']}")
-                
-                # Check for duplicates
-                if check_duplicate_transaction(
-                    user_id,
-                    parsed['merchant'],
-                    parsed['amount'],
-                    parsed['date']
-                ):
-                    print(f"  ⚠️ Duplicate transaction, skipping")
-                    total_duplicates += 1
-                    continue
-                
-                # Categorize merchant
-                category = categorize_merchant(parsed['merchant'])
-                print(f"  ✓ Category: {category}")
-                
-                # Insert into database
-                transaction_id = insert_transaction(
-                    user_id=user_id,
-                    merchant=parsed['merchant'],
-                    amount=parsed['amount'],
-                    category=category,
-                    date=parsed['date'],
-                    email_subject=email['subject']
-                )
-                
-                if transaction_id:
-                    print(f"  ✅ Saved to database (ID: {transaction_id})")
-                    total_inserted += 1
-                else:
-                    print(f"  ❌ Failed to save to database")
-                    total_failed += 1
-                
-                print()  # Blank line between emails
+                logger.info(f"  ✓ Parsed: {parsed['merchant']} - ₹{parsed['amount']}\n")
+                parsed_emails.append((email, parsed))
                 
             except Exception as e:
-                print(f"  ❌ Error processing email: {e}\n")
+                logger.error(f"  ❌ Error processing email: {e}\n")
                 total_failed += 1
                 continue
         
-        # Step 4: Summary
-        print(f"\n{'='*60}")
-        print("📊 PROCESSING SUMMARY")
-        print(f"{'='*60}")
-        print(f"Total emails processed:     {total_processed}")
-        print(f"Successfully parsed:        {total_parsed}")
-        print(f"Duplicates skipped:         {total_duplicates}")
-        print(f"New transactions inserted:  {total_inserted}")
-        print(f"Failed/skipped:             {total_failed}")
-        print(f"{'='*60}\n")
+        # Step 4: Check all parsed transactions for duplicates in one query,
+        # before any of them are sent to Gemini
+        logger.info("🔎 Step 4: Checking for duplicates...")
+        seen = find_existing_transactions(
+            user_id,
+            [(p['merchant'], p['amount'], p['date']) for _, p in parsed_emails]
+        )
+        
+        new_emails = []
+        for email, parsed in parsed_emails:
+            key = (parsed['merchant'], parsed['amount'], parsed['date'])
+            if key in seen:
+                logger.info(f"  ⚠️ Duplicate transaction, skipping: {parsed['merchant']} - ₹{parsed['amount']}")
+                total_duplicates += 1
+                continue
+            
+            # The same transaction can arrive twice in one fetch
+            seen.add(key)
+            new_emails.append((email, parsed))
+        
+        # Step 5: Categorize and insert the new transactions in bulk. A run
+        # that inserted the same rows since Step 4 trips dedup_idx instead.
+        logger.info(f"\n💾 Step 5: Saving {len(new_emails)} new transactions...")
+        categories = categorize_merchants([p['merchant'] for _, p in new_emails])
+        transaction_ids, duplicates = insert_transactions_many(user_id, [
+            {
+                'merchant': parsed['merchant'],
+                'amount': parsed['amount'],
+                'category': category,
+                'date': parsed['date'],
+                'email_subject': email['subject']
+            }
+            for (email, parsed), category in zip(new_emails, categories)
+        ])
+        
+        results = zip(new_emails, categories, transaction_ids)
+        for i, ((email, parsed), category, transaction_id) in enumerate(results):
+            if transaction_id:
+                logger.info(f"  ✅ Saved {parsed['merchant']} as {category} (ID: {transaction_id})")
+                total_inserted += 1
+            elif i in duplicates:
+                logger.info(f"  ⚠️ Duplicate transaction, skipping: {parsed['merchant']} - ₹{parsed['amount']}")
+                total_duplicates += 1
+            else:
+                logger.error(f"  ❌ Failed to save {parsed['merchant']} to database")
+                total_failed += 1
+                failed_ids.append(email['message_id'])
+        
+        _save_sync_state(user_id, history_id, new_history_id, pending, failed_ids)
+        
+        # Step 6: Summary
+        logger.info("\n" + "="*60)
+        logger.info("📊 PROCESSING SUMMARY")
+        logger.info("="*60)
+        logger.info(f"Total emails processed:     {total_processed}")
+        logger.info(f"Successfully parsed:        {total_parsed}")
+        logger.info(f"Duplicates skipped:         {total_duplicates}")
+        logger.info(f"New transactions inserted:  {total_inserted}")
+        logger.info(f"Failed/skipped:             {total_failed}")
+        logger.info("="*60 + "\n")
         
         return {
             'success': True,
@@ -203,7 +306,7 @@ def process_all_transactions(user_id: str) -> Dict:
         }
         
     except Exception as e:
-        print(f"\n❌ Fatal error in process_all_transactions: {e}")
+        logger.error(f"\n❌ Fatal error in process_all_transactions: {e}")
         return {
             'success': False,
             'total_new': total_inserted,
@@ -212,8 +315,22 @@ def process_all_transactions(user_id: str) -> Dict:
         }
 
 
+async def process_all_transactions_async(user_id: str) -> Dict:
+    """
+    Run process_all_transactions in a worker thread, one run per user at a time
+    
+    Args:
+        user_id: User identifier
+    
+    Returns:
+        Dictionary with processing summary: {success, total_new, total_failed, message}
+    """
+    async with _user_locks[user_id]:
+        return await asyncio.to_thread(process_all_transactions, user_id)
+
+
 # Example usage
 if __name__ == "__main__":
     # Test the pipeline
     result = process_all_transactions(user_id="test_user_123")
-    print(f"\nFinal result: {result}")
+    logger.info(f"\nFinal result: {result}")
@@ -0,0 +1,14 @@
+"""
+pytest configuration: make the backend modules importable
+
+The backend imports its modules by bare name (e.g. `from parser import ...`),
+so the tests put backend/ on sys.path and do the same.
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -5,94 +5,122 @@ Tests all components and API endpoints
 
 import sys
 import os
-from datetime import datetime
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 
 print("🧪 SplitMint Backend Test Suite")
 print("="*60 + "\n")
 
 # Test 1: MongoDB Connection
-print("Test 1: MongoDB Connection")
-print("-"*40)
-try:
-    from SplitMint.backend.db import connect_db
-    result = connect_db()
-    if result:
-        print("✅ PASS: MongoDB connected successfully\n")
-    else:
-        print("❌ FAIL: MongoDB connection failed\n")
-except Exception as e:
-    print(f"❌ FAIL: {e}\n")
+def run_test_1():
+    """Run Test 1 and return its title and output lines"""
+    log = []
+    
+    try:
+        from SplitMint.backend.db import connect_db
+        result = connect_db()
+        if result:
+            log.append("✅ PASS: MongoDB connected successfully\n")
+        else:
+            log.append("❌ FAIL: MongoDB connection failed\n")
+    except Exception as e:
+        log.append(f"❌ FAIL: {e}\n")
+    
+    return "Test 1: MongoDB Connection", log
+
 
 # Test 2: Transaction Parsing
-print("Test 2: Transaction Parsing")
-print("-"*40)
-try:
-    from SplitMint.backend.parser import parse_transaction_from_email
+def run_test_2():
+    """Run Test 2 and return its title and output lines"""
+    log = []
     
-    test_cases = [
-        {
-            "subject": "Payment Alert",
-            "body": "Rs. 450 spent at Domino's Pizza on 15 Oct 2025",
-            "expected_merchant": "Domino's Pizza",
-            "expected_amount": 450
-        },
-        {
-            "subject": "Transaction Alert",
-            "body": "₹1299 debited to Amazon on 18/10/2025",
-            "expected_merchant": "Amazon",
-            "expected_amount": 1299
-        }
-    ]
-    
-    passed = 0
-    for i, test in enumerate(test_cases, 1):
-        result = parse_transaction_from_email(test['subject'], test['body'])
-        if result and result['amount'] == test['expected_amount']:
-            print(f"  ✅ Test {i} PASS: {result['merchant']} - ₹{result['amount']}")
-            passed += 1
-        else:
-            print(f"  ❌ Test {i} FAIL: Expected ₹{test['expected_amount']}, got {result}")
+    try:
+        from SplitMint.backend.parser import parse_transaction_from_email
+        
+        test_cases = [
+            {
+                "subject": "Payment Alert",
+                "body": "Rs. 450 spent at Domino's Pizza on 15 Oct 2025",
+                "expected_merchant": "Domino's Pizza",
+                "expected_amount": 450
+            },
+            {
+                "subject": "Transaction Alert",
+                "body": "₹1299 debited to Amazon on 18/10/2025",
+                "expected_merchant": "Amazon",
+                "expected_amount": 1299
+            }
+        ]
+        
+        passed = 0
+        for i, test in enumerate(test_cases, 1):
+            result = parse_transaction_from_email(test['subject'], test['body'])
+            if result and result['amount'] == test['expected_amount']:
+                log.append(f"  ✅ Test {i} PASS: {result['merchant']} - ₹{result['amount']}")
+                passed += 1
+            else:
+                log.append(f"  ❌ Test {i} FAIL: Expected ₹{test['expected_amount']}, got {result}")
+        
+        log.append(f"\nParsing Tests: {passed}/{len(test_cases)} passed\n")
     
-    print(f"\nParsing Tests: {passed}/{len(test_cases)} passed\n")
+    except Exception as e:
+        log.append(f"❌ FAIL: {e}\n")
     
-except Exception as e:
-    print(f"❌ FAIL: {e}\n")
+    return "Test 2: Transaction Parsing", log
+
 
 # Test 3: Merchant Categorization
-print("Test 3: Merchant Categorization")
-print("-"*40)
-try:
-    from SplitMint.backend.categorizer import categorize_merchant
-    
-    test_merchants = [
-        ("Domino's Pizza", ["Food & Dining"]),
-        ("Amazon India", ["Shopping & E-commerce"]),
-        ("Netflix", ["Entertainment"]),
-        ("Uber", ["Transport"]),
-        ("Apollo Pharmacy", ["Healthcare"]),
-    ]
-    
-    passed = 0
-    for merchant, expected_categories in test_merchants:
-        category = categorize_merchant(merchant)
-        if category in expected_categories:
-            print(f"  ✅ {merchant:25} → {category}")
-            passed += 1
-        else:
-            print(f"  ❌ {merchant:25} → {category} (expected one of {expected_categories})")
+def run_test_3():
+    """Run Test 3 and return its title and output lines"""
+    log = []
+    
+    try:
+        from SplitMint.backend.categorizer import categorize_merchant
+        
+        test_merchants = [
+            ("Domino's Pizza", ["Food and Drinks"]),
+            ("Amazon India", ["Shopping"]),
+            ("Netflix", ["Entertainment"]),
+            ("Uber", ["Travel and Transport"]),
+            ("Apollo Pharmacy", ["Healthcare"]),
+        ]
+        
+        passed = 0
+        for merchant, expected_categories in test_merchants:
+            category = categorize_merchant(merchant)
+            if category in expected_categories:
+                log.append(f"  ✅ {merchant:25} → {category}")
+                passed += 1
+            else:
+                log.append(f"  ❌ {merchant:25} → {category} (expected one of {expected_categories})")
+        
+        log.append(f"\nCategorization Tests: {passed}/{len(test_merchants)} passed\n")
     
-    print(f"\nCategorization Tests: {passed}/{len(test_merchants)} passed\n")
+    except Exception as e:
+        log.append(f"❌ FAIL: {e}\n")
     
-except Exception as e:
-    print(f"❌ FAIL: {e}\n")
+    return "Test 3: Merchant Categorization", log
+
+
+# Tests 1-3 are independent, so run them together and print in order
+with ThreadPoolExecutor(max_workers=3) as pool:
+    futures = [pool.submit(run_test_1), pool.submit(run_test_2), pool.submit(run_test_3)]
+
+for future in futures:
+    title, log = future.result()
+    print(title)
+    print("-"*40)
+    print("\n".join(log))
 
 # Test 4: Database Operations
 print("Test 4: Database Operations")
 print("-"*40)
 try:
-    from SplitMint.backend.db import insert_transaction, get_transactions, update_budget, get_budget
+    from SplitMint.backend.db import insert_transaction, insert_transactions_many, get_transactions, update_budget, get_budget
     
-    test_user = "test_user_" + datetime.now().strftime("%Y%m%d%H%M%S")
+    # Random suffix: runs started in the same second don't share a user
+    test_user = "test_user_" + secrets.token_hex(8)
     test_month = "2025-10"
     
     # Test insert transaction
@@ -100,7 +128,7 @@ try:
         user_id=test_user,
         merchant="Test Merchant",
         amount=100.50,
-        category="Food & Dining",
+        category="Food and Drinks",
         date="2025-10-28"
     )
     
@@ -109,9 +137,25 @@ try:
     else:
         print(f"  ❌ Transaction insert failed")
     
+    # Test bulk insert: seed 10 rows in one round trip
+    seed_ids, _ = insert_transactions_many(test_user, [
+        {
+            "merchant": f"Test Merchant {i}",
+            "amount": 100.0 + i,
+            "category": "Shopping",
+            "date": f"{test_month}-{i:02d}"
+        }
+        for i in range(1, 11)
+    ])
+    
+    if all(seed_ids) and len(seed_ids) == 10:
+        print(f"  ✅ Bulk inserted {len(seed_ids)} transactions")
+    else:
+        print(f"  ❌ Bulk insert failed: {seed_ids}")
+    
     # Test get transactions
     transactions = get_transactions(test_user)
-    if len(transactions) > 0:
+    if len(transactions) >= 11:
         print(f"  ✅ Retrieved {len(transactions)} transaction(s)")
     else:
         print(f"  ❌ Failed to retrieve transactions")
@@ -144,39 +188,47 @@ print("\nThen test manually using:")
 print("  - Browser: http://localhost:8000/docs")
 print("  - Or use curl/httpx to test endpoints")
 
-try:
+
+async def run_api_tests():
+    """Hit the running server's endpoints over one pooled connection"""
     import httpx
     
-    print("\n  Attempting to connect to server...")
-    response = httpx.get("http://localhost:8000/health", timeout=2.0)
-    
-    if response.status_code == 200:
+    async with httpx.AsyncClient(base_url="http://localhost:8000", timeout=5.0) as client:
+        print("\n  Attempting to connect to server...")
+        response = await client.get("/health", timeout=2.0)
+        
+        if response.status_code != 200:
+            print(f"  ❌ Server returned status {response.status_code}")
+            return
+        
         print(f"  ✅ Server is running!")
         print(f"  ✅ Health check: {response.json()}")
         
         # Test other endpoints
         test_user = "test_user_api"
+        test_month = "2025-10"
         
-        # Test load demo data
-        demo_response = httpx.post(
-            "http://localhost:8000/api/load-demo-data",
-            json={"user_id": test_user, "month": "2025-10"},
-            timeout=5.0
+        # Test load demo data (the reads below depend on it)
+        demo_response = await client.post(
+            "/api/load-demo-data",
+            json={"user_id": test_user, "month": test_month}
         )
         if demo_response.status_code == 200:
             print(f"  ✅ Demo data loaded: {demo_response.json()}")
         
-        # Test get transactions
-        trans_response = httpx.get(
-            f"http://localhost:8000/api/transactions?user_id={test_user}",
-            timeout=5.0
+        # Test get transactions and spending breakdown concurrently
+        trans_response, spending_response = await asyncio.gather(
+            client.get("/api/transactions", params={"user_id": test_user}),
+            client.get("/api/spending-by-category", params={"user_id": test_user, "month": test_month})
         )
         if trans_response.status_code == 200:
             print(f"  ✅ Transactions retrieved: {trans_response.json()['count']} items")
-        
-    else:
-        print(f"  ❌ Server returned status {response.status_code}")
-        
+        if spending_response.status_code == 200:
+            print(f"  ✅ Spending by category: {len(spending_response.json()['data']['breakdown'])} categories")
+
+
+try:
+    asyncio.run(run_api_tests())
 except Exception as e:
     print(f"  ⚠️  Server not running or error: {e}")
     print(f"  💡 Start server with: uvicorn main:app --reload")
@@ -2,9 +2,18 @@
 Test script to demonstrate the enhanced categorization system
 """
 
-from SplitMint.backend.categorizer import categorize_merchant, get_valid_categories
+import operator
+import os
+import sys
 
-def test_categorization():
+if __name__ == "__main__":
+    # Run as a script: put backend/ on sys.path, as tests/conftest.py does under pytest
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from categorizer import categorize_merchants, get_valid_categories
+
+def run_categorization() -> float:
+    """Categorize the sample merchants, print the results and return the accuracy"""
     print("=" * 80)
     print("SPLITMINT - ENHANCED CATEGORIZATION SYSTEM")
     print("=" * 80)
@@ -107,27 +116,30 @@ def test_categorization():
         ]
     }
     
-    # Test each category
-    total_tests = 0
-    correct_predictions = 0
+    # Flatten the cases once: merchants and their expected categories line up
+    pairs = [(m, category) for category, merchants in test_cases.items() for m in merchants]
+    all_merchants = [m for m, _ in pairs]
+    expected = [category for _, category in pairs]
+    
+    # Categorize every merchant in batched requests, in test case order
+    predictions = categorize_merchants(all_merchants)
+    
+    # Score all predictions in one pass
+    total_tests = len(all_merchants)
+    correct_predictions = sum(map(operator.eq, predictions, expected))
     
+    # Show results per category
+    remaining = iter(predictions)
     for expected_category, merchants in test_cases.items():
-        print(f"\n{expected_category}")
-        print("-" * 80)
+        # Build the whole category block, then write it at once
+        lines = [f"\n{expected_category}", "-" * 80]
         
         for merchant in merchants:
-            predicted_category = categorize_merchant(merchant)
-            total_tests += 1
-            
-            # Check if prediction matches expected
-            is_correct = predicted_category == expected_category
-            if is_correct:
-                correct_predictions += 1
-                status = "✅"
-            else:
-                status = "❌"
-            
-            print(f"{status} {merchant:45s} -> {predicted_category}")
+            predicted_category = next(remaining)
+            status = "✅" if predicted_category == expected_category else "❌"
+            lines.append(f"{status} {merchant:45s} -> {predicted_category}")
+        
+        print("\n".join(lines))
     
     # Print summary
     print("\n" + "=" * 80)
@@ -138,7 +150,18 @@ def test_categorization():
     print(f"Accuracy: {(correct_predictions/total_tests)*100:.1f}%")
     print(f"\nNote: Using Gemini AI (gemini-2.0-flash-exp) with keyword fallback")
     print("=" * 80)
+    
+    return correct_predictions / total_tests
+
+
+def test_categorization(monkeypatch):
+    # Gemini is only called when RUN_GEMINI_TESTS=1, so the suite doesn't
+    # spend API quota or depend on the model's answers by default
+    if os.getenv("RUN_GEMINI_TESTS") != "1":
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    
+    assert run_categorization() > 0.7
 
 
 if __name__ == "__main__":
-    test_categorization()
+    run_categorization()
@@ -1,77 +1,149 @@
 """
 Test delete transaction functionality
+
+Run as a script to delete a user's latest transaction interactively, or
+with pytest (server running on localhost:8000) to check the delete flow
+on a freshly added transaction.
 """
 
-import requests
-import json
+import argparse
+import secrets
+import httpx
+import orjson
+import pytest
 
 API_BASE = "http://localhost:8000"
 
-print("\n" + "="*60)
-print("🧪 TESTING DELETE TRANSACTION")
-print("="*60 + "\n")
 
-# First, let's get the transactions to find one to delete
-user_id = "test_user_123"
+def make_client() -> httpx.Client:
+    """Create the API client shared by every call in a run, over one kept-alive connection"""
+    return httpx.Client(base_url=API_BASE, timeout=5.0)
 
-print("📋 Step 1: Getting transactions...")
-response = requests.get(f"{API_BASE}/api/transactions", params={
-    "user_id": user_id,
-    "limit": 10
-})
 
-if response.status_code == 200:
-    data = response.json()
-    transactions = data.get('data', {}).get('transactions', [])
-    
-    print(f"✅ Found {len(transactions)} transaction(s)\n")
+def main():
+    """Delete a user's latest transaction, asking first unless --yes is given"""
+    arg_parser = argparse.ArgumentParser(description="Delete a user's latest transaction through the API")
+    arg_parser.add_argument("--yes", action="store_true", help="Delete without asking for confirmation")
+    arg_parser.add_argument("--user-id", default="test_user_123", help="User whose transaction is deleted")
+    args = arg_parser.parse_args()
     
-    if transactions:
-        # Show the first transaction
-        txn = transactions[0]
-        print(f"Transaction to delete:")
-        print(f"  ID: {txn['_id']}")
-        print(f"  Merchant: {txn['merchant']}")
-        print(f"  Amount: ₹{txn['amount']}")
-        print(f"  Category: {txn['category']}")
-        print(f"  Date: {txn['date']}\n")
+    with make_client() as client:
+        print("\n" + "="*60)
+        print("🧪 TESTING DELETE TRANSACTION")
+        print("="*60 + "\n")
         
-        # Ask for confirmation
-        confirm = input("Delete this transaction? (yes/no): ")
+        # First, let's get the transactions to find one to delete
+        user_id = args.user_id
         
-        if confirm.lower() == 'yes':
-            print("\n🗑️ Step 2: Deleting transaction...")
+        print("📋 Step 1: Getting transactions...")
+        # Only the first transaction is used, so fetch just that one
+        response = client.get("/api/transactions", params={
+            "user_id": user_id,
+            "limit": 1,
+            "fields": "_id,merchant,amount,category,date"
+        })
+        
+        if response.status_code == 200:
+            payload = orjson.loads(response.content)
+            transactions = payload["data"]["transactions"] if payload.get("data") else []
             
-            delete_response = requests.delete(
-                f"{API_BASE}/api/delete-transaction",
-                json={
-                    "user_id": user_id,
-                    "transaction_id": txn['_id']
-                }
-            )
+            print(f"✅ Found {len(transactions)} transaction(s)\n")
             
-            if delete_response.status_code == 200:
-                result = delete_response.json()
-                print(f"✅ {result['message']}\n")
-                
-                # Verify deletion
-                print("📋 Step 3: Verifying deletion...")
-                verify_response = requests.get(f"{API_BASE}/api/transactions", params={
-                    "user_id": user_id,
-                    "limit": 10
-                })
+            if transactions:
+                # Show the first transaction
+                txn = transactions[0]
+                print(f"Transaction to delete:")
+                print(f"  ID: {txn['_id']}")
+                print(f"  Merchant: {txn['merchant']}")
+                print(f"  Amount: ₹{txn['amount']}")
+                print(f"  Category: {txn['category']}")
+                print(f"  Date: {txn['date']}\n")
                 
-                if verify_response.status_code == 200:
-                    verify_data = verify_response.json()
-                    remaining = verify_data.get('data', {}).get('transactions', [])
-                    print(f"✅ Remaining transactions: {len(remaining)}\n")
+                # Ask for confirmation unless --yes was given
+                if args.yes or input("Delete this transaction? (yes/no): ").lower() == 'yes':
+                    print("\n🗑️ Step 2: Deleting transaction...")
+                    
+                    delete_response = client.request(
+                        "DELETE",
+                        "/api/delete-transaction",
+                        json={
+                            "user_id": user_id,
+                            "transaction_id": txn['_id']
+                        }
+                    )
+                    
+                    if delete_response.status_code == 200:
+                        result = orjson.loads(delete_response.content)
+                        print(f"✅ {result['message']}\n")
+                        
+                        # Verify deletion
+                        print("📋 Step 3: Verifying deletion...")
+                        verify_response = client.get("/api/transactions", params={
+                            "user_id": user_id,
+                            "limit": 10,
+                            "fields": "_id"
+                        })
+                        
+                        if verify_response.status_code == 200:
+                            verify_payload = orjson.loads(verify_response.content)
+                            remaining = verify_payload["data"]["transactions"] if verify_payload.get("data") else []
+                            print(f"✅ Remaining transactions: {len(remaining)}\n")
+                    else:
+                        print(f"❌ Delete failed: {delete_response.text}\n")
+                else:
+                    print("\n❌ Deletion cancelled\n")
             else:
-                print(f"❌ Delete failed: {delete_response.text}\n")
+                print("❌ No transactions found to delete\n")
         else:
-            print("\n❌ Deletion cancelled\n")
-    else:
-        print("❌ No transactions found to delete\n")
-else:
-    print(f"❌ Failed to get transactions: {response.text}\n")
+            print(f"❌ Failed to get transactions: {response.text}\n")
+        
+        print("="*60 + "\n")
+
+
+# ============================================================
+# pytest: add a transaction, delete it, check it is gone
+# ============================================================
+
+@pytest.fixture
+def client():
+    """API client; skips the test when the server isn't running"""
+    with make_client() as api_client:
+        try:
+            api_client.get("/health")
+        except httpx.TransportError:
+            pytest.skip(f"API server not running at {API_BASE}")
+        yield api_client
+
+
+@pytest.fixture
+def seeded_txn(client):
+    """Add one transaction for a fresh user; returns (user_id, transaction_id)"""
+    user_id = "test_user_" + secrets.token_hex(8)
+    response = client.post("/api/add-transaction", json={
+        "user_id": user_id,
+        "merchant": "Test Merchant",
+        "amount": 100.5,
+        "category": "Others",
+        "date": "2025-10-28"
+    })
+    assert response.status_code == 200, response.text
+    return user_id, orjson.loads(response.content)["data"]["transaction_id"]
+
+
+def test_delete_transaction(client, seeded_txn):
+    user_id, transaction_id = seeded_txn
+    
+    delete_response = client.request("DELETE", "/api/delete-transaction", json={
+        "user_id": user_id,
+        "transaction_id": transaction_id
+    })
+    assert delete_response.status_code == 200, delete_response.text
+    
+    verify_response = client.get("/api/transactions", params={"user_id": user_id, "fields": "_id"})
+    assert verify_response.status_code == 200
+    remaining = orjson.loads(verify_response.content)["data"]["transactions"]
+    assert transaction_id not in {txn["_id"] for txn in remaining}
+
 
-print("="*60 + "\n")
+if __name__ == "__main__":
+    main()